@@ -1,22 +1,36 @@
-import base64
+import importlib
 import io
+import os
 import sqlite3
 from pathlib import Path
 from typing import Callable
 
+import matplotlib
+
+matplotlib.use("Agg", force=True)  # headless raster backend; must precede pyplot
+
 import matplotlib.pyplot as plt
 import streamlit as st
 
+try:
+    import pybase64 as base64  # SIMD encoder, same API as the stdlib module
+except ImportError:
+    import base64
+
 from core.entities import Match, Player, Team
 from crawler.match_base import MatchBase
-from viz.gold_contribution import GoldContribution
-from viz.gold_map import GoldMap
-from viz.player_profile import PlayerProfile
-from viz.spider_stats import SpiderStats
-from viz.nn_infer import predict_match_outcome, build_speedometer
 
 DB_DEFAULT_PATH = "data/match_base/live.db"
 
+# viz module -> class; modules (and torch via nn_infer) are imported on
+# first render so the draft-only page load never pays for them.
+VIZ_CLASSES = {
+    "gold_contribution": "GoldContribution",
+    "gold_map": "GoldMap",
+    "player_profile": "PlayerProfile",
+    "spider_stats": "SpiderStats",
+}
+
 APP_STYLES = """
 <style>
 .stApp {background: radial-gradient(circle at 12% 20%, rgba(59,130,246,0.25), transparent 35%),
@@ -54,65 +68,146 @@ def inject_styles():
     st.markdown(APP_STYLES + PLAYER_POPOVER_STYLES, unsafe_allow_html=True)
 
 
-@st.cache_resource(show_spinner=False)
-def load_match_base(db_path: str) -> MatchBase:
-    """Cache a MatchBase wrapper so we reuse the same SQLite connection."""
+@st.cache_resource(show_spinner=False, max_entries=2)
+def load_match_base(db_path: str, db_mtime: float) -> MatchBase:
+    """
+    Cache a MatchBase wrapper so we reuse the same SQLite connection.
+    db_mtime opens a new one once promote_update_db os.replace()s the file;
+    the old connection would keep reading the unlinked inode.
+    """
     return MatchBase(live_path=db_path, update_path=f"{db_path}.tmp")
 
 
+@st.cache_resource(show_spinner=False)
+def configure_torch():
+    """Process-wide torch setup, done once: a few intra-op threads suit [1,10,13] forwards."""
+    import torch
+
+    torch.set_num_threads(min(4, os.cpu_count() or 1))
+
+
 @st.cache_data(show_spinner=False)
-def load_players(db_path: str):
+def load_players(db_path: str, db_mtime: float):
     """Return ordered player metadata (most recently scraped first)."""
-    if not Path(db_path).exists():
-        return []
     with sqlite3.connect(db_path) as conn:
         rows = conn.execute(
             "SELECT puuid, tier, last_scraped FROM players ORDER BY last_scraped DESC"
         ).fetchall()
+    conn.close()
     return rows
 
 
-def fig_to_base64(fig) -> str:
-    """Convert a Matplotlib figure to a data URI string."""
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", bbox_inches="tight")
-    plt.close(fig)
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
+@st.cache_resource(show_spinner=False, max_entries=2 * len(VIZ_CLASSES))
+def load_viz(db_path: str, db_mtime: float, name: str):
+    """Cache one visualization instance per module, sharing the MatchBase."""
+    module = importlib.import_module(f"viz.{name}")
+    return getattr(module, VIZ_CLASSES[name])(load_match_base(db_path, db_mtime))
 
 
-def render_player_popovers(player_profile: PlayerProfile, match: Match, label_map: dict[str, str]):
-    """Render hoverable pills that reveal player profile plots."""
+def fig_to_buffer(fig, dpi: float | None = None, pad_inches: float = 0.05) -> io.BytesIO:
+    """Rasterize a Matplotlib figure to an in-memory PNG and close it."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", pad_inches=pad_inches, dpi=dpi)
+    plt.close(fig)
+    return buf
+
+
+def fig_to_base64(fig, max_width_px: int = 720) -> str:
+    """Convert a Matplotlib figure to a data URI string no wider than max_width_px."""
+    # size the raster to the display instead of a full-dpi PNG the browser
+    # downsamples; callers pass 2x the CSS width so HiDPI screens stay sharp
+    dpi = max_width_px / fig.get_size_inches()[0]
+    return base64.b64encode(fig_to_buffer(fig, dpi=dpi).getbuffer()).decode("ascii")
+
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def player_profile_png(db_path: str, db_mtime: float, puuid: str) -> str | None:
+    """Render one player's profile to base64 PNG; db_mtime busts stale entries."""
+    fig = load_viz(db_path, db_mtime, "player_profile").build_figure(Player(puuid))
+    # popover img is 360px wide in CSS; 2x keeps 8pt labels legible
+    return fig_to_base64(fig, max_width_px=720) if fig else None
+
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def match_figure_png(
+    db_path: str, db_mtime: float, name: str, blue_ids: tuple, red_ids: tuple
+) -> bytes | None:
+    """Render a match-level viz to PNG bytes; unchanged rosters hit the cache."""
+    fig = load_viz(db_path, db_mtime, name).build_figure(build_match(blue_ids, red_ids))
+    # same savefig settings as st.pyplot, so the cached PNG renders like it did
+    return fig_to_buffer(fig, dpi=200, pad_inches=0.1).getvalue() if fig else None
+
+
+def player_pill_html(label: str, puuid: str, img_src: str | None) -> str:
+    """Assemble one hover pill; joins parts so the base64 payload is copied once."""
+    if img_src:
+        inner = ("<img src='data:image/png;base64,", img_src, f"' alt='Profile {puuid[:8]}'>")
+    else:
+        inner = ("<div class='player-popover-empty'>No profile data</div>",)
+    return "".join((
+        "<div class='player-pill'>", label, "<div class='player-popover'>",
+        *inner,
+        "</div></div>",
+    ))
+
+
+def player_popovers_html(match_base: MatchBase, match: Match, label_map: dict[str, str]) -> str:
+    """Build hoverable pills for both sides that reveal player profile plots."""
+    db_path = match_base.live_path
+    db_mtime = Path(db_path).stat().st_mtime
+    parts = []
     for side_label, team in (("Blue", match.blue), ("Red", match.red)):
-        st.markdown(f"**{side_label} side**")
-        pills = []
-        for player in team.players:
-            fig = player_profile.build_figure(player)
-            if fig:
-                img_src = fig_to_base64(fig)
-                inner = f"<img src='data:image/png;base64,{img_src}' alt='Profile {player.puuid[:8]}'>"
-            else:
-                inner = "<div class='player-popover-empty'>No profile data</div>"
-            label = label_map.get(player.puuid, player.puuid[:12])
-            pills.append(
-                f"<div class='player-pill'>{label}<div class='player-popover'>{inner}</div></div>"
+        parts.append(f"<p><strong>{side_label} side</strong></p><div class='player-pill-row'>")
+        parts.extend(
+            player_pill_html(
+                label_map.get(player.puuid, player.puuid[:12]),
+                player.puuid,
+                player_profile_png(db_path, db_mtime, player.puuid),
             )
+            for player in team.players
+        )
+        parts.append("</div>")
+    return "".join(parts)
+
+
+def render_card(
+    title: str,
+    body_cb: Callable[[], None] | None = None,
+    description: str | None = None,
+    body_html: str = "",
+):
+    """Emit a card in one markdown call; body_cb adds native elements below it."""
+    extra = f"<p class='viz-desc'>{description}</p>" if description else ""
+    with st.container():
         st.markdown(
-            f"<div class='player-pill-row'>{''.join(pills)}</div>",
+            "".join(("<div class='viz-card'><h3>", title, "</h3>", extra, body_html, "</div>")),
             unsafe_allow_html=True,
         )
+        if body_cb:
+            body_cb()
 
 
-def render_card(title: str, body_cb: Callable[[], None], description: str | None = None):
-    extra = f"<p class='viz-desc'>{description}</p>" if description else ""
-    st.markdown(f"<div class='viz-card'><h3>{title}</h3>{extra}", unsafe_allow_html=True)
-    body_cb()
-    st.markdown("</div>", unsafe_allow_html=True)
+def build_option_labels(label_map: dict[str, str]) -> dict[str, str]:
+    """Selectbox labels keyed by option, including the empty placeholder."""
+    return {"": "— select player —", **label_map}
 
 
-def format_player_option(option: str, label_map: dict[str, str]) -> str:
-    if not option:
-        return "— select player —"
-    return label_map.get(option, option[:12])
+def build_roster(players) -> tuple[list[str], dict[str, str], dict[str, str]]:
+    """Derive selector ids, display labels and option labels from player rows."""
+    player_ids = [row[0] for row in players]
+    label_map = {
+        row[0]: f"{row[0][:12]}… ({row[1] or 'tier ?'})" for row in players
+    }
+    return player_ids, label_map, build_option_labels(label_map)
+
+
+def session_memo(key: str, token, build: Callable[[], object]):
+    """Return the value stored under key, rebuilding it only when token changes."""
+    slot = st.session_state.get(key)
+    if slot is None or slot[0] != token:
+        slot = (token, build())
+        st.session_state[key] = slot
+    return slot[1]
 
 
 def current_team_selection(side: str) -> list[str]:
@@ -122,18 +217,14 @@ def current_team_selection(side: str) -> list[str]:
 def build_team_selector(
     side: str,
     player_ids: list[str],
-    label_map: dict[str, str],
+    option_labels: dict[str, str],
     exclude_other: set[str] | None = None,
 ):
     selections = []
-    used: set[str] = set()
-    exclude_other = exclude_other or set()
+    taken: set[str] = set(exclude_other or ())
 
     for role in Team.ROLES_ORDER:
-        remaining = [
-            pid for pid in player_ids
-            if pid not in used and pid not in exclude_other
-        ]
+        remaining = [pid for pid in player_ids if pid not in taken]
         options = [""] + remaining
         key = f"{side}_{role}"
         current = st.session_state.get(key, "")
@@ -145,11 +236,11 @@ def build_team_selector(
             f"{side.title()} {role}",
             options,
             index=index,
-            format_func=lambda opt, lm=label_map: format_player_option(opt, lm),
+            format_func=option_labels.get,
             key=key,
         )
         if choice:
-            used.add(choice)
+            taken.add(choice)
         selections.append(choice)
     return [sel for sel in selections if sel]
 
@@ -164,7 +255,13 @@ def build_match(blue_ids, red_ids):
 
 
 def render_viz(match_base: MatchBase, match: Match, label_map: dict[str, str]):
+    from viz.nn_infer import predict_match_outcome, build_speedometer
+    configure_torch()
+
     inference = predict_match_outcome(match_base, match)
+    db_path = match_base.live_path
+    db_mtime = Path(db_path).stat().st_mtime
+    blue_ids, red_ids = tuple(match.blue.puuids), tuple(match.red.puuids)
 
     def draw_inference():
         gauge_fig = build_speedometer(inference["blue_success"])
@@ -178,11 +275,9 @@ def render_viz(match_base: MatchBase, match: Match, label_map: dict[str, str]):
     render_card("Neural inference (blue ↔ red tilt)", draw_inference)
 
     def draw_gold_contribution():
-        gold_viz = GoldContribution(match_base)
-        gold_fig = gold_viz.build_figure(match)
-        if gold_fig:
-            st.pyplot(gold_fig)
-            plt.close(gold_fig)
+        png = match_figure_png(db_path, db_mtime, "gold_contribution", blue_ids, red_ids)
+        if png:
+            st.image(png, width="stretch")
         else:
             st.info("Gold contribution figure unavailable for the selected players.")
 
@@ -193,11 +288,9 @@ def render_viz(match_base: MatchBase, match: Match, label_map: dict[str, str]):
     )
 
     def draw_gold_map():
-        gold_map_viz = GoldMap(match_base)
-        gold_map_fig = gold_map_viz.build_figure(match)
-        if gold_map_fig:
-            st.pyplot(gold_map_fig)
-            plt.close(gold_map_fig)
+        png = match_figure_png(db_path, db_mtime, "gold_map", blue_ids, red_ids)
+        if png:
+            st.image(png, width="stretch")
         else:
             st.info("No overlapping matches to render the gold map heatmaps.")
 
@@ -208,21 +301,18 @@ def render_viz(match_base: MatchBase, match: Match, label_map: dict[str, str]):
     )
 
     def draw_spider():
-        spider_viz = SpiderStats(match_base)
-        spider_fig = spider_viz.build_figure(match)
-        if spider_fig:
-            st.pyplot(spider_fig)
-            plt.close(spider_fig)
+        png = match_figure_png(db_path, db_mtime, "spider_stats", blue_ids, red_ids)
+        if png:
+            st.image(png, width="stretch")
         else:
             st.info("Not enough historical stats to build the spider chart.")
 
     render_card("Spider stats (team comparison)", draw_spider)
 
-    def draw_profiles():
-        player_profile_viz = PlayerProfile(match_base)
-        render_player_popovers(player_profile_viz, match, label_map)
-
-    render_card("Player profiles (hover for detail)", draw_profiles)
+    render_card(
+        "Player profiles (hover for detail)",
+        body_html=player_popovers_html(match_base, match, label_map),
+    )
 
 
 def main():
@@ -242,8 +332,9 @@ def main():
         return
     st.caption(f"Using MatchBase at `{db_path}`")
 
-    match_base = load_match_base(db_path)
-    players = load_players(db_path)
+    db_mtime = Path(db_path).stat().st_mtime
+    match_base = load_match_base(db_path, db_mtime)
+    players = load_players(db_path, db_mtime)
     if not players:
         st.warning("No players found. Seed or update the database first.")
         return
@@ -255,21 +346,20 @@ def main():
     stats_cols[1].metric("Matches stored", match_count)
     stats_cols[2].metric("DB", "Live cache")
 
-    player_ids = [row[0] for row in players]
-    label_map = {
-        row[0]: f"{row[0][:12]}… ({row[1] or 'tier ?'})" for row in players
-    }
+    player_ids, label_map, option_labels = session_memo(
+        "roster", db_mtime, lambda: build_roster(players)
+    )
 
     st.markdown("### Draft teams")
     cols = st.columns(2, gap="large")
     red_taken = {pid for pid in current_team_selection("red") if pid}
     with cols[0]:
         st.markdown("<div class='team-panel'><h3>Blue side</h3>", unsafe_allow_html=True)
-        blue_ids = build_team_selector("blue", player_ids, label_map, exclude_other=red_taken)
+        blue_ids = build_team_selector("blue", player_ids, option_labels, exclude_other=red_taken)
         st.markdown("</div>", unsafe_allow_html=True)
     with cols[1]:
         st.markdown("<div class='team-panel'><h3>Red side</h3>", unsafe_allow_html=True)
-        red_ids = build_team_selector("red", player_ids, label_map, exclude_other=set(blue_ids))
+        red_ids = build_team_selector("red", player_ids, option_labels, exclude_other=set(blue_ids))
         st.markdown("</div>", unsafe_allow_html=True)
 
     if len(blue_ids) != 5 or len(red_ids) != 5:
@@ -280,7 +370,9 @@ def main():
         st.warning("A player cannot be on both teams. Adjust your selections.")
         return
 
-    match = build_match(blue_ids, red_ids)
+    match = session_memo(
+        "match", (tuple(blue_ids), tuple(red_ids)), lambda: build_match(blue_ids, red_ids)
+    )
     if not match:
         st.error("Unable to build the match with the chosen players.")
         return
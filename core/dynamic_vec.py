@@ -0,0 +1,23 @@
+"""
+player_features.dynamic_vec layout, shared by the crawler (writer) and the
+ML dataset (reader). Stdlib only so either side can import it.
+"""
+
+import struct
+
+# Fixed layout of player_features.dynamic_vec (little‑endian float32 each)
+DYNAMIC_FIELDS = (
+    "kills_avg", "deaths_avg", "assists_avg", "kda", "gold_per_min",
+    "cs_per_min", "vision_score", "damage_to_champs", "win_rate_recent",
+)
+DYNAMIC_STRUCT = struct.Struct(f"<{len(DYNAMIC_FIELDS)}f")
+
+
+def pack_dynamic(dynamic):
+    """Pack FeatureBuilder's dynamic averages into a dynamic_vec BLOB (missing → 0.0)."""
+    return DYNAMIC_STRUCT.pack(*(float(dynamic.get(f) or 0.0) for f in DYNAMIC_FIELDS))
+
+
+def unpack_dynamic(blob):
+    """Inverse of pack_dynamic: dynamic_vec BLOB → {field: value}."""
+    return dict(zip(DYNAMIC_FIELDS, DYNAMIC_STRUCT.unpack(blob)))
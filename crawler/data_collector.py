@@ -14,7 +14,6 @@ inside the organised architecture.
 """
 
 import asyncio
-import aiohttp
 from .riot_api_client import RiotAPIClient
 from .db_handler import DatabaseHandler
 
@@ -23,17 +22,22 @@ from .db_handler import DatabaseHandler
 # --------------------------------------------------------------------------- #
 
 ROLES_ORDER = ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY"]
+ROLE_INDEX = {role: i for i, role in enumerate(ROLES_ORDER)}
+RANKED_SOLO_QUEUE = 420
 
 def order_puuids_by_role(players):
     """Return 10 PUUIDs in fixed [blue roles, red roles] order."""
-    blue, red = [], []
-    for role in ROLES_ORDER:
-        for p in players:
-            if p["teamId"] == 100 and p["teamPosition"] == role:
-                blue.append(p["puuid"])
-            if p["teamId"] == 200 and p["teamPosition"] == role:
-                red.append(p["puuid"])
-    return blue + red
+    blue = [[] for _ in ROLES_ORDER]
+    red = [[] for _ in ROLES_ORDER]
+    for p in players:
+        idx = ROLE_INDEX.get(p["teamPosition"])
+        if idx is None:
+            continue
+        if p["teamId"] == 100:
+            blue[idx].append(p["puuid"])
+        elif p["teamId"] == 200:
+            red[idx].append(p["puuid"])
+    return [pid for slot in blue + red for pid in slot]
 
 def compute_label(info):
     """
@@ -42,8 +46,12 @@ def compute_label(info):
     """
     teams = info["teams"]
     win100 = teams[0]["win"]
-    gold100 = sum(p["goldEarned"] for p in info["participants"] if p["teamId"] == 100)
-    gold200 = sum(p["goldEarned"] for p in info["participants"] if p["teamId"] == 200)
+    gold100 = gold200 = 0
+    for p in info["participants"]:
+        if p["teamId"] == 100:
+            gold100 += p["goldEarned"]
+        elif p["teamId"] == 200:
+            gold200 += p["goldEarned"]
     ratio = gold100 / (gold100 + gold200)
     win_flag = 1.0 if win100 else 0.0
     return 0.55 * ratio + 0.45 * win_flag
@@ -62,10 +70,10 @@ class PlayerCollector:
 
     async def seed_players(self):
         """Populate player table with ladder PUUIDs."""
-        async with aiohttp.ClientSession() as session:
-            puuids = await self.api.get_all_tier_puuids(session)
-            for p in puuids:
-                self.db.insert_player(p)
+        session = self.api.session()
+        puuids = await self.api.get_all_tier_puuids(session)
+        with self.db.txn():
+            self.db.insert_players_bulk([(p, None, 0) for p in puuids])
         count = self.db.conn.execute("SELECT COUNT(*) FROM players").fetchone()[0]
         print(f"✅  Seeded {count} players from ladders.")
 
@@ -92,54 +100,71 @@ class MatchCrawler:
         self.db = db
         self.mpp = matches_per_player
         self.target = target_matches
+        self.rejected = set()   # match ids already fetched and discarded
+        self.fetch_sem = asyncio.Semaphore(10)
+
+    async def _fetch_detail(self, session, mid):
+        async with self.fetch_sem:
+            return mid, await self.api.get_match_detail(session, mid)
 
     async def run(self):
-        async with aiohttp.ClientSession() as session:
+        session = self.api.session()
+        processed = self.db.match_count()
+        while processed < self.target:
+            players = self.db.player_batches(limit=5)
+            if not players:
+                print("⚠️ No players left to scrape.")
+                break
+
+            for puuid in players:
+                ids = await self.api.get_match_ids(
+                    session, puuid, count=self.mpp, queue=RANKED_SOLO_QUEUE
+                ) or []
+                known = self.db.existing_match_ids(ids)
+                pending = [
+                    mid for mid in ids
+                    if mid not in self.rejected and mid not in known
+                ]
+                # fetch details concurrently, write them serially
+                results = await asyncio.gather(
+                    *(self._fetch_detail(session, mid) for mid in pending)
+                )
+                discovered = set()
+                self.db.begin()
+                for mid, match in results:
+                    if not match or "info" not in match:
+                        continue
+                    info = match["info"]
+
+                    # keep only ranked solo queue
+                    if info.get("queueId") != RANKED_SOLO_QUEUE:
+                        self.rejected.add(mid)
+                        continue
+
+                    ordered = order_puuids_by_role(info["participants"])
+                    if len(ordered) != 10:
+                        self.rejected.add(mid)
+                        continue
+
+                    label = compute_label(info)
+                    self.db.insert_match(mid, info, ordered, label)
+                    processed = self.db.match_count()
+
+                    # remember PUUIDs from this match; written once per player
+                    discovered.update(match["metadata"]["participants"])
+
+                    if processed % 5 == 0:
+                        print(f"🟢  {processed} / {self.target} matches stored.")
+
+                # add any new PUUIDs from this player's matches in one go
+                self.db.insert_players_bulk([(pid, None, 1) for pid in discovered])
+                self.db.mark_in_match(discovered)
+
+                # one commit per player batch, flushed off the event loop
+                self.db.mark_scraped(puuid)
+                await self.db.commit_async()
+
+            # refresh loop condition
             processed = self.db.match_count()
-            while processed < self.target:
-                players = self.db.player_batches(limit=5)
-                if not players:
-                    print("⚠️ No players left to scrape.")
-                    break
-
-                for puuid in players:
-                    ids = await self.api.get_match_ids(session, puuid, count=self.mpp)
-                    for mid in ids:
-                        if self.db.match_exists(mid):
-                            continue
-
-                        match = await self.api.get_match_detail(session, mid)
-                        if not match or "info" not in match:
-                            continue
-                        info = match["info"]
-
-                        # keep only ranked solo queue
-                        if info.get("queueId") != 420:
-                            continue
-
-                        ordered = order_puuids_by_role(info["participants"])
-                        if len(ordered) != 10:
-                            continue
-
-                        label = compute_label(info)
-                        self.db.insert_match(mid, info, ordered, label)
-                        processed = self.db.match_count()
-
-                        # add any new PUUIDs from this match
-                        for pid in match["metadata"]["participants"]:
-                            self.db.insert_player(pid, discovered=1)
-                            self.db.conn.execute(
-                                "UPDATE players SET in_match=1 WHERE puuid=?",
-                                (pid,)
-                            )
-                        self.db.conn.commit()
-
-                        if processed % 5 == 0:
-                            print(f"🟢  {processed} / {self.target} matches stored.")
-
-                    self.db.mark_scraped(puuid)
-
-                # refresh loop condition
-                processed = self.db.match_count()
-
-            print(f"✅  Crawl completed: {processed} matches in database.")
\ No newline at end of file
+
+        print(f"✅  Crawl completed: {processed} matches in database.")
\ No newline at end of file
@@ -1,4 +1,12 @@
-import sqlite3, time, json
+import asyncio, sqlite3, time
+from contextlib import contextmanager
+import orjson
+
+
+def dumps(obj):
+    """orjson-encode to str so columns stay TEXT (readable by json_extract)."""
+    return orjson.dumps(obj).decode()
+
 
 class DatabaseHandler:
     """
@@ -10,16 +18,74 @@ class DatabaseHandler:
     """
 
     def __init__(self, path="data/matches.db"):
-        # connect allows multiple threads via check_same_thread=False if async tasks later write
-        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # connect allows multiple threads via check_same_thread=False if async tasks later write.
+        # isolation_level=None: no implicit BEGIN before DML; writers batch via
+        # txn() or begin()/commit_async(), anything else autocommits on its own
+        self.conn = sqlite3.connect(
+            path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=512,
+        )
+        self._apply_pragmas()
         self._create_core_tables()
         self._apply_migrations()
         self._create_indexes()
-        self.conn.commit()
 
     # ------------------------------------------------------------------ #
     # --- schema helpers ------------------------------------------------#
     # ------------------------------------------------------------------ #
+    def _apply_pragmas(self):
+        # WAL + NORMAL sync: one fsync per checkpoint instead of per commit
+        self.conn.executescript("""
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA mmap_size=268435456;
+        PRAGMA cache_size=-65536;
+        PRAGMA wal_autocheckpoint=1000;
+        PRAGMA busy_timeout=5000;
+        """)
+
+    def checkpoint(self):
+        """Merge the -wal file into the main DB so the .db file alone is complete."""
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def analyze(self):
+        """Refresh planner statistics so index choice reflects the finished DB."""
+        self.conn.execute("ANALYZE")
+
+    def begin(self):
+        """Open a write transaction unless one is already running."""
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN IMMEDIATE")
+
+    @contextmanager
+    def txn(self):
+        """
+        Run a block of writes as one BEGIN IMMEDIATE … COMMIT (rollback on
+        error). Joins the caller's transaction if one is already open.
+        Keep awaits out of the block so the write lock is not held across I/O.
+        """
+        if self.conn.in_transaction:
+            yield self.conn
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    async def commit_async(self):
+        """
+        conn.commit() on a worker thread so the event loop keeps serving HTTP
+        while SQLite flushes. Only await it when no other coroutine is
+        using the connection.
+        """
+        await asyncio.to_thread(self.conn.commit)
+
     def _create_core_tables(self):
         self.conn.executescript("""
         CREATE TABLE IF NOT EXISTS players (
@@ -28,7 +94,8 @@ class DatabaseHandler:
             discovered INTEGER DEFAULT 0,
             in_match INTEGER DEFAULT 0,
             has_features INTEGER DEFAULT 0,
-            last_scraped REAL
+            last_scraped REAL,
+            last_match_ts REAL
         );
 
         CREATE TABLE IF NOT EXISTS matches (
@@ -50,6 +117,7 @@ class DatabaseHandler:
             timestamp REAL,
             role TEXT,
             stats_json TEXT,
+            gold INTEGER,
             PRIMARY KEY (puuid, match_id)
         );
 
@@ -58,6 +126,7 @@ class DatabaseHandler:
             tier_norm REAL,
             static_json TEXT,
             dynamic_json TEXT,
+            dynamic_vec BLOB,
             games_used INTEGER,
             last_updated REAL
         );
@@ -94,25 +163,54 @@ class DatabaseHandler:
             column="player_gold_json",
             definition="TEXT"
         )
+        self._ensure_column(
+            table="player_features",
+            column="dynamic_vec",
+            definition="BLOB"
+        )
+        self._ensure_column(
+            table="players",
+            column="last_match_ts",
+            definition="REAL"
+        )
+        if self._ensure_column(
+            table="player_match_stats",
+            column="gold",
+            definition="INTEGER"
+        ):
+            # one-off backfill so viz queries never decode stats_json for gold
+            self.conn.execute(
+                "UPDATE player_match_stats "
+                "SET gold = json_extract(stats_json, '$.gold')"
+            )
 
     def _ensure_column(self, table, column, definition):
+        """Add <column> if missing; returns True when it was just added."""
         cur = self.conn.execute(f"PRAGMA table_info({table})")
         columns = {row[1] for row in cur.fetchall()}
         if column not in columns:
             self.conn.execute(
                 f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
             )
+            return True
+        return False
 
     def _create_indexes(self):
         self.conn.executescript("""
-        CREATE INDEX IF NOT EXISTS idx_player_time
-            ON player_match_stats (puuid, timestamp);
+        -- gold rides along so recent-gold averages are index-only scans;
+        -- the (puuid, timestamp) prefix still serves every other lookup
+        DROP INDEX IF EXISTS idx_player_time;
+        CREATE INDEX IF NOT EXISTS idx_player_time_gold
+            ON player_match_stats (puuid, timestamp, gold);
         CREATE INDEX IF NOT EXISTS idx_match_id
             ON player_match_stats (match_id);
-        CREATE INDEX IF NOT EXISTS idx_match_complete
-            ON matches (vector_complete);
+        DROP INDEX IF EXISTS idx_match_complete;
+        CREATE INDEX IF NOT EXISTS idx_match_complete_id
+            ON matches (vector_complete, match_id);
         CREATE INDEX IF NOT EXISTS idx_features_puuid
             ON player_features (puuid);
+        CREATE INDEX IF NOT EXISTS idx_players_last_scraped
+            ON players (last_scraped);
         """)
 
     # ------------------------------------------------------------------ #
@@ -123,12 +221,25 @@ class DatabaseHandler:
             "INSERT OR IGNORE INTO players(puuid, tier, discovered) VALUES(?,?,?)",
             (puuid, tier, discovered)
         )
-        self.conn.commit()
+
+    def insert_players_bulk(self, rows):
+        """Insert many (puuid, tier, discovered) rows in one executemany call."""
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO players(puuid, tier, discovered) VALUES(?,?,?)",
+            rows
+        )
+
+    def mark_in_match(self, puuids):
+        self.conn.executemany(
+            "UPDATE players SET in_match=1 WHERE puuid=?",
+            [(p,) for p in puuids]
+        )
 
     def player_batches(self, limit=10):
-        # SQLite uses IS NULL, not 'NULLS FIRST' syntax
+        # SQLite sorts NULLs first on ASC, so never-scraped players lead and
+        # the plain ORDER BY can walk idx_players_last_scraped without a sort
         cur = self.conn.execute(
-            "SELECT puuid FROM players ORDER BY last_scraped IS NULL DESC, last_scraped ASC LIMIT ?",
+            "SELECT puuid FROM players ORDER BY last_scraped ASC LIMIT ?",
             (limit,)
         )
         return [r[0] for r in cur.fetchall()]
@@ -138,25 +249,55 @@ class DatabaseHandler:
             "UPDATE players SET last_scraped=? WHERE puuid=?",
             (time.time(), puuid)
         )
-        self.conn.commit()
+
+    def last_match_ts(self, puuid):
+        """
+        gameStartTimestamp (ms) of the newest game from <puuid>'s own match
+        list, or None (→ caller does a full last-10 fetch). Stats rows are no
+        fallback: they are also written when the player merely appears in
+        someone else's match, which would hide their own older games.
+        """
+        row = self.conn.execute(
+            "SELECT last_match_ts FROM players WHERE puuid=?", (puuid,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def bump_last_match_ts(self, puuid, ts):
+        self.conn.execute(
+            "UPDATE players SET last_match_ts=MAX(COALESCE(last_match_ts, 0), ?) WHERE puuid=?",
+            (ts, puuid)
+        )
 
     # ------------------------------------------------------------------ #
     # --- match helpers -------------------------------------------------#
     # ------------------------------------------------------------------ #
-    def match_exists(self, mid):
-        cur = self.conn.execute("SELECT 1 FROM matches WHERE match_id=?", (mid,))
-        return cur.fetchone() is not None
+    def existing_match_ids(self, mids):
+        """Return the subset of <mids> already stored, in one IN query."""
+        if not mids:
+            return set()
+        marks = ",".join("?" * len(mids))
+        cur = self.conn.execute(
+            f"SELECT match_id FROM matches WHERE match_id IN ({marks})", list(mids)
+        )
+        return {r[0] for r in cur}
 
     def insert_match(self, mid, info, ordered_puuids, label):
         ts = info.get("gameStartTimestamp", time.time())
         teams = info.get("teams", []) or []
         participants = info.get("participants", []) or []
-        player_gold = {
-            p.get("puuid"): p.get("goldEarned", 0)
-            for p in participants if p.get("puuid")
-        }
-        blue_gold = sum(p.get("goldEarned", 0) for p in participants if p.get("teamId") == 100)
-        red_gold = sum(p.get("goldEarned", 0) for p in participants if p.get("teamId") == 200)
+        # one pass over participants for per-player and per-side gold
+        player_gold = {}
+        blue_gold = red_gold = 0
+        for p in participants:
+            g = p.get("goldEarned", 0)
+            puuid = p.get("puuid")
+            if puuid:
+                player_gold[puuid] = g
+            tid = p.get("teamId")
+            if tid == 100:
+                blue_gold += g
+            elif tid == 200:
+                red_gold += g
         winner_side = None
         for team in teams:
             tid = team.get("teamId")
@@ -176,14 +317,13 @@ class DatabaseHandler:
             mid,
             ts,
             time.time(),
-            json.dumps(ordered_puuids),
+            dumps(ordered_puuids),
             label,
             winner_side,
             blue_gold,
             red_gold,
-            json.dumps(player_gold),
+            dumps(player_gold),
         ))
-        self.conn.commit()
 
     def match_count(self):
         cur = self.conn.execute("SELECT COUNT(*) FROM matches")
@@ -192,17 +332,34 @@ class DatabaseHandler:
     # ------------------------------------------------------------------ #
     # --- player_match_stats helpers -----------------------------------#
     # ------------------------------------------------------------------ #
-    def insert_player_match(self, puuid, match_id, timestamp, role, stats_dict):
+    def insert_player_matches_bulk(self, rows):
         """
-        Insert or replace one player's stats for one match.
-        Encapsulates JSON‑serialization and commit for clarity.
+        Insert or replace (puuid, match_id, timestamp, role, stats_dict) rows
+        in one executemany. Encapsulates JSON‑serialization; the caller commits.
         """
-        self.conn.execute("""
+        self.conn.executemany("""
             INSERT OR REPLACE INTO player_match_stats
-                (puuid, match_id, timestamp, role, stats_json)
-            VALUES (?,?,?,?,?)
-        """, (puuid, match_id, timestamp, role, json.dumps(stats_dict)))
-        self.conn.commit()
+                (puuid, match_id, timestamp, role, stats_json, gold)
+            VALUES (?,?,?,?,?,?)
+        """, [
+            (p, mid, ts, role, dumps(stats), stats.get("gold"))
+            for p, mid, ts, role, stats in rows
+        ])
+
+    def stored_match_ids(self, puuid, mids):
+        """
+        Return {match_id: timestamp} for the subset of <mids> already stored
+        for <puuid>, in one IN query.
+        """
+        if not mids:
+            return {}
+        marks = ",".join("?" * len(mids))
+        cur = self.conn.execute(
+            f"SELECT match_id, timestamp FROM player_match_stats "
+            f"WHERE puuid=? AND match_id IN ({marks})",
+            (puuid, *mids)
+        )
+        return dict(cur.fetchall())
 
     def get_recent_matches(self, puuid, limit=10):
         """Return latest <limit> matches for a player as list of (match_id, stats_json)."""
@@ -217,12 +374,16 @@ class DatabaseHandler:
 
     def delete_old_matches(self, puuid, keep=10):
         """Slide‑window cleanup: delete all but <keep> most recent matches."""
+        # one ranked pass over idx_player_time_gold (puuid, timestamp) instead of
+        # a NOT IN subquery probed for every row
         self.conn.execute("""
             DELETE FROM player_match_stats
-            WHERE rowid NOT IN (
-                SELECT rowid FROM player_match_stats
-                WHERE puuid=? ORDER BY timestamp DESC LIMIT ?
-            )
-            AND puuid=?;
-        """, (puuid, keep, puuid))
-        self.conn.commit()
\ No newline at end of file
+            WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (ORDER BY timestamp DESC) AS rn
+                    FROM player_match_stats
+                    WHERE puuid=?
+                )
+                WHERE rn > ?
+            );
+        """, (puuid, keep))
\ No newline at end of file
@@ -11,15 +11,26 @@ FeatureBuilder – builds player feature vectors match‑by‑match.
 ✓ reports progress
 """
 
-import asyncio, aiohttp, json, time, statistics
+import asyncio, time
+import numpy as np
+import orjson
 from pathlib import Path
-from .riot_api_client import RiotAPIClient, HEADERS, PLATFORM_REGION
-from .db_handler import DatabaseHandler
-from .data_collector import compute_label
+from core.dynamic_vec import pack_dynamic
+from .riot_api_client import RiotAPIClient, PLATFORM_REGION
+from .db_handler import DatabaseHandler, dumps
 
 CACHE_DIR = Path("cache/player_matches")
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
+TIER_NORM = {
+    "IRON": 0.05, "BRONZE": 0.1, "SILVER": 0.2,
+    "GOLD": 0.3, "PLATINUM": 0.4, "EMERALD": 0.5, "DIAMOND": 0.6,
+    "MASTER": 0.75, "GRANDMASTER": 0.9, "CHALLENGER": 1.0
+}
+
+STATIC_TTL = 3600          # seconds an in‑memory statics entry stays valid
+STATIC_CACHE_SIZE = 50_000
+
 # --------------------------------------------------------------------------- #
 # Feature builder class
 # --------------------------------------------------------------------------- #
@@ -27,29 +38,34 @@ CACHE_DIR.mkdir(parents=True, exist_ok=True)
 class FeatureBuilder:
     def __init__(self, api: RiotAPIClient, db: DatabaseHandler):
         self.api, self.db = api, db
+        self.static_cache = {}   # puuid → (expires_at, statics)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.api.close()
 
     # ------------------ utility ------------------------------------------------
     def tier_to_norm(self, tier):
-        mapping = {
-            None: 0.3, "IRON": 0.05, "BRONZE": 0.1, "SILVER": 0.2,
-            "GOLD": 0.3, "PLATINUM": 0.4, "EMERALD": 0.5, "DIAMOND": 0.6,
-            "MASTER": 0.75, "GRANDMASTER": 0.9, "CHALLENGER": 1.0
-        }
-        return mapping.get(tier.upper() if tier else None, 0.3)
+        if not tier:
+            return 0.3
+        # Riot already sends upper‑case tiers; only normalise on a miss
+        norm = TIER_NORM.get(tier)
+        return norm if norm is not None else TIER_NORM.get(tier.upper(), 0.3)
 
-    def next_unprocessed_match(self):
+    def next_unprocessed_matches(self, limit=100):
         cur = self.db.conn.execute(
             "SELECT match_id FROM matches "
-            "WHERE vector_complete IS NULL OR vector_complete=0 LIMIT 1"
+            "WHERE vector_complete IS NULL OR vector_complete=0 LIMIT ?",
+            (limit,)
         )
-        row = cur.fetchone()
-        return row[0] if row else None
+        return [r[0] for r in cur.fetchall()]
 
     def mark_complete(self, mid):
         self.db.conn.execute(
             "UPDATE matches SET vector_complete=1 WHERE match_id=?", (mid,)
         )
-        self.db.conn.commit()
 
     # ------------------ static enrichment -------------------------------------
     async def fetch_remote_statics(self, session, puuid):
@@ -58,7 +74,7 @@ class FeatureBuilder:
 
         # rank (league‑v4 by‑puuid)
         u = f"https://{PLATFORM_REGION}.api.riotgames.com/lol/league/v4/entries/by-puuid/{puuid}"
-        ranks = await self.api._safe_get(session, u)
+        ranks = await self.api.cached_get(session, u)
         if isinstance(ranks, list):
             for e in ranks:
                 if e.get("queueType") == "RANKED_SOLO_5x5":
@@ -69,20 +85,20 @@ class FeatureBuilder:
 
         # summoner‑v4 (level / icon)
         u = f"https://{PLATFORM_REGION}.api.riotgames.com/lol/summoner/v4/summoners/by-puuid/{puuid}"
-        summ = await self.api._safe_get(session, u)
+        summ = await self.api.cached_get(session, u)
         if summ:
             statics["summoner_level"] = summ.get("summonerLevel")
             statics["profile_icon"] = summ.get("profileIconId")
 
         # mastery total score
         u = f"https://{PLATFORM_REGION}.api.riotgames.com/lol/champion-mastery/v4/scores/by-puuid/{puuid}"
-        score = await self.api._safe_get(session, u)
+        score = await self.api.cached_get(session, u)
         if isinstance(score, (int, float)):
             statics["mastery_score"] = score
 
         # challenge total points
         u = f"https://{PLATFORM_REGION}.api.riotgames.com/lol/challenges/v1/player-data/{puuid}"
-        ch = await self.api._safe_get(session, u)
+        ch = await self.api.cached_get(session, u)
         if ch:
             statics["challenge_points"] = ch.get("totalPoints", {}).get("current")
 
@@ -90,143 +106,205 @@ class FeatureBuilder:
         return statics
 
     def get_cached_static(self, puuid):
+        hit = self.static_cache.get(puuid)
+        if hit and hit[0] > time.monotonic():
+            return hit[1]
         row = self.db.conn.execute(
             "SELECT static_json FROM player_features WHERE puuid=?", (puuid,)
         ).fetchone()
         if row and row[0]:
             try:
-                return json.loads(row[0])
+                statics = orjson.loads(row[0])
             except Exception:
-                pass
+                return None
+            self.remember_static(puuid, statics)
+            return statics
         return None
 
+    def remember_static(self, puuid, statics):
+        """Keep statics in memory for STATIC_TTL; oldest entries go first when full."""
+        self.static_cache.pop(puuid, None)
+        if len(self.static_cache) >= STATIC_CACHE_SIZE:
+            del self.static_cache[next(iter(self.static_cache))]
+        self.static_cache[puuid] = (time.monotonic() + STATIC_TTL, statics)
+
     # ------------------ dynamic aggregation -----------------------------------
-    def aggregate_history(self, matches_json, puuid):
-        k, d, a, gpm, cspm, vis, dmg, w = [], [], [], [], [], [], [], []
-        for m in matches_json:
-            info = m.get("info", {})
-            dur = max(1, info.get("gameDuration", 1) / 60)
-            for p in info.get("participants", []):
-                if p.get("puuid") == puuid:
-                    k.append(p.get("kills", 0))
-                    d.append(p.get("deaths", 0))
-                    a.append(p.get("assists", 0))
-                    gpm.append(p.get("goldEarned", 0) / dur)
-                    cspm.append(
-                        (p.get("totalMinionsKilled", 0)
-                         + p.get("neutralMinionsKilled", 0)) / dur
-                    )
-                    vis.append(p.get("visionScore", 0))
-                    dmg.append(p.get("totalDamageDealtToChampions", 0))
-                    w.append(1 if p.get("win") else 0)
-                    break
-        if not k:
+    @staticmethod
+    def history_row(match, puuid):
+        """
+        Flatten one match to the target player's numbers:
+        [minutes, kills, deaths, assists, gold, cs, vision, damage, win].
+        None if the player is not in the match.
+        """
+        info = match.get("info", {})
+        for p in info.get("participants", []):
+            if p.get("puuid") == puuid:
+                return [
+                    max(1, info.get("gameDuration", 1) / 60),
+                    p.get("kills", 0),
+                    p.get("deaths", 0),
+                    p.get("assists", 0),
+                    p.get("goldEarned", 0),
+                    p.get("totalMinionsKilled", 0) + p.get("neutralMinionsKilled", 0),
+                    p.get("visionScore", 0),
+                    p.get("totalDamageDealtToChampions", 0),
+                    1 if p.get("win") else 0,
+                ]
+        return None
+
+    def aggregate_history(self, rows):
+        if not rows:
             return {}
+        arr = np.asarray(rows, dtype=np.float64)
+        # gold and cs become per-minute before the single column-wise mean
+        arr[:, 4:6] /= arr[:, :1]
+        _, k, d, a, gpm, cspm, vis, dmg, win = arr.mean(axis=0).tolist()
         return {
-            "kills_avg": statistics.mean(k),
-            "deaths_avg": statistics.mean(d),
-            "assists_avg": statistics.mean(a),
-            "kda": (statistics.mean(k) + statistics.mean(a)) / max(1, statistics.mean(d)),
-            "gold_per_min": statistics.mean(gpm),
-            "cs_per_min": statistics.mean(cspm),
-            "vision_score": statistics.mean(vis),
-            "damage_to_champs": statistics.mean(dmg),
-            "win_rate_recent": sum(w)/len(w),
+            "kills_avg": k,
+            "deaths_avg": d,
+            "assists_avg": a,
+            "kda": (k + a) / max(1, d),
+            "gold_per_min": gpm,
+            "cs_per_min": cspm,
+            "vision_score": vis,
+            "damage_to_champs": dmg,
+            "win_rate_recent": win,
         }
 
     async def fetch_history(self, session, puuid):
-        cache_file = CACHE_DIR / f"{puuid}.json"
+        """
+        Recent history as history_row() rows. Only these small rows are
+        cached, so a cache hit skips parsing ten full match payloads. A
+        history with any failed request is returned but not cached, so the
+        next run refetches it instead of keeping the gap for good.
+        """
+        cache_file = CACHE_DIR / f"{puuid}.rows.json"
         if cache_file.exists():
             try:
-                return json.loads(cache_file.read_text())
+                return orjson.loads(cache_file.read_bytes())
             except Exception:
                 pass
         ids = await self.api.get_match_ids(session, puuid, count=10)
-        out = []
-        for mid in ids:
-            m = await self.api.get_match_detail(session, mid)
-            if m:
-                out.append(m)
-            await asyncio.sleep(0.25)
-        cache_file.write_text(json.dumps(out))
+        if ids is None:
+            print(f"[warn] match ids for {puuid[:8]} unavailable")
+            return []
+        # RiotAPIClient's semaphore + cooldown pace these, no extra sleep needed
+        matches = await asyncio.gather(
+            *(self.api.get_match_detail(session, mid) for mid in ids),
+            return_exceptions=True,
+        )
+        out, failed = [], 0
+        for m in matches:
+            if not m or isinstance(m, BaseException):
+                failed += 1
+                continue
+            row = self.history_row(m, puuid)
+            if row:
+                out.append(row)
+        if failed:
+            print(f"[warn] {failed}/{len(ids)} matches for {puuid[:8]} unavailable")
+        else:
+            cache_file.write_bytes(orjson.dumps(out))
         return out
 
     # ------------------ per‑match processing ----------------------------------
     async def process_match(self, mid):
-        async with aiohttp.ClientSession(headers=HEADERS) as session:
-            match = await self.api.get_match_detail(session, mid)
-            if not match or "info" not in match:
-                print(f"[warn] match {mid} unavailable")
-                return False
-
-            info = match["info"]
-            label = compute_label(info)
-
-            for p in info.get("participants", []):
-                puuid = p["puuid"]
-                static_data = self.get_cached_static(puuid)
-                if not static_data:
-                    static_data = await self.fetch_remote_statics(session, puuid)
-                    self.db.conn.execute(
-                        "UPDATE players SET tier=?, last_scraped=? WHERE puuid=?",
-                        (static_data.get("tier"), time.time(), puuid),
-                    )
-                    self.db.conn.commit()
-
-                hist = await self.fetch_history(session, puuid)
-                dynamic = self.aggregate_history(hist, puuid)
-                dynamic["label"] = label
-                dynamic["tier_norm"] = static_data.get("tier_norm", 0.3)
-
-                self.db.conn.execute("""
-                    INSERT OR REPLACE INTO player_features
-                        (puuid, tier_norm, static_json, dynamic_json,
-                         games_used, last_updated)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    puuid,
-                    static_data.get("tier_norm", 0.3),
-                    json.dumps(static_data),
-                    json.dumps(dynamic),
-                    len(hist),
-                    time.time(),
-                ))
-                self.db.conn.execute(
-                    "UPDATE players SET has_features=1 WHERE puuid=?", (puuid,)
-                )
-                self.db.conn.commit()
-
+        session = self.api.session()
+        match = await self.api.get_match_detail(session, mid)
+        if not match or "info" not in match:
+            print(f"[warn] match {mid} unavailable")
+            return False
+
+        info = match["info"]
+
+        async def collect(puuid):
+            static_data = self.get_cached_static(puuid)
+            fresh_static = not static_data
+            if fresh_static:
+                static_data = await self.fetch_remote_statics(session, puuid)
+
+            hist = await self.fetch_history(session, puuid)
+            dynamic = self.aggregate_history(hist)
+            return puuid, static_data, fresh_static, dynamic, len(hist)
+
+        # Network first, all participants concurrently (the API client's
+        # semaphore still caps in‑flight requests); writes then land in one txn
+        puuids = list(dict.fromkeys(p["puuid"] for p in info.get("participants", [])))
+        rows = await asyncio.gather(*(collect(puuid) for puuid in puuids))
+
+        now = time.time()
+        feature_rows = [
+            (
+                puuid,
+                static_data.get("tier_norm", 0.3),
+                dumps(static_data),
+                pack_dynamic(dynamic),
+                games_used,
+                now,
+            )
+            for puuid, static_data, _, dynamic, games_used in rows
+        ]
+        # NULL tier/last_scraped keeps the stored value (cached statics)
+        player_updates = [
+            (static_data.get("tier"), now, puuid) if fresh_static else (None, None, puuid)
+            for puuid, static_data, fresh_static, _, _ in rows
+        ]
+
+        with self.db.txn():
+            self.db.conn.executemany("""
+                INSERT OR REPLACE INTO player_features
+                    (puuid, tier_norm, static_json, dynamic_vec,
+                     games_used, last_updated)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, feature_rows)
+            self.db.conn.executemany("""
+                UPDATE players
+                SET has_features=1,
+                    tier=COALESCE(?, tier),
+                    last_scraped=COALESCE(?, last_scraped)
+                WHERE puuid=?
+            """, player_updates)
             self.mark_complete(mid)
-            print(f"✅ match {mid} | {len(info['participants'])} players updated")
-            return True
+        # the rows just written are the freshest statics for these players
+        for puuid, static_data, _, _, _ in rows:
+            self.remember_static(puuid, static_data)
+        print(f"✅ match {mid} | {len(info['participants'])} players updated")
+        return True
 
     # ------------------ run loop ----------------------------------------------
     async def run(self, max_matches=None, report_interval=1):
         processed = 0
+        skipped = set()
         while True:
-            mid = self.next_unprocessed_match()
-            if not mid:
+            # Over-fetch by len(skipped) so failed ids can't fill the whole batch
+            pending = self.next_unprocessed_matches(100 + len(skipped))
+            batch = [m for m in pending if m not in skipped]
+            if not batch:
+                if skipped:
+                    print(f"⚠️ {len(skipped)} match(es) skipped this run")
                 print("✅ all matches already vector_complete.")
                 break
 
-            ok = await self.process_match(mid)
-            if not ok:
-                print(f"⚠️ skipping {mid}")
-                continue
+            for mid in batch:
+                ok = await self.process_match(mid)
+                if not ok:
+                    print(f"⚠️ skipping {mid}")
+                    skipped.add(mid)
+                    continue
 
-            processed += 1
-            if processed % report_interval == 0:
-                done = self.db.conn.execute(
-                    "SELECT COUNT(*) FROM matches WHERE vector_complete=1"
-                ).fetchone()[0]
-                total = self.db.conn.execute(
-                    "SELECT COUNT(*) FROM matches"
-                ).fetchone()[0]
-                print(f"[{time.strftime('%H:%M:%S')}] {done}/{total} matches complete")
-
-            if max_matches and processed >= max_matches:
-                print(f"⏸ stopped after {processed} match(es)")
-                break
+                processed += 1
+                if processed % report_interval == 0:
+                    done = self.db.conn.execute(
+                        "SELECT COUNT(*) FROM matches WHERE vector_complete=1"
+                    ).fetchone()[0]
+                    total = self.db.conn.execute(
+                        "SELECT COUNT(*) FROM matches"
+                    ).fetchone()[0]
+                    print(f"[{time.strftime('%H:%M:%S')}] {done}/{total} matches complete")
+
+                if max_matches and processed >= max_matches:
+                    print(f"⏸ stopped after {processed} match(es)")
+                    return
 
 
 # --------------------------------------------------------------------------- #
@@ -235,9 +313,8 @@ class FeatureBuilder:
 
 async def main():
     db = DatabaseHandler("data/matches.db")
-    api = RiotAPIClient()
-    fb = FeatureBuilder(api, db)
-    await fb.run(max_matches=20, report_interval=5)
+    async with FeatureBuilder(RiotAPIClient(), db) as fb:
+        await fb.run(max_matches=20, report_interval=5)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
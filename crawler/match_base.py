@@ -16,11 +16,21 @@ O – Open for extension: tier lists, update strategies, caching.
 L – Stable API contracts with RiotAPIClient and DatabaseHandler.
 """
 
-import asyncio, aiohttp, shutil, os, time, json
+import asyncio, os, sqlite3, time
 from .riot_api_client import RiotAPIClient
 from .db_handler import DatabaseHandler
 from .data_collector import compute_label, order_puuids_by_role
 
+# stats_json key → Riot participant field, read in one comprehension per player
+STATS_FIELDS = (
+    ("kills", "kills"),
+    ("deaths", "deaths"),
+    ("assists", "assists"),
+    ("gold", "goldEarned"),
+    ("damage", "totalDamageDealtToChampions"),
+    ("vision", "visionScore"),
+)
+
 
 class MatchBase:
     """Orchestrates Riot‑API data collection and persistence."""
@@ -38,6 +48,12 @@ class MatchBase:
         self.level_min = None
         self.level_max = None
 
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.api.close()
+
     # ------------------------------------------------------------- #
     # --- Utility helpers ----------------------------------------- #
     # ------------------------------------------------------------- #
@@ -80,23 +96,22 @@ class MatchBase:
         if cur.fetchone():
             return True
 
-        async with aiohttp.ClientSession() as session:
-            url = (
-                f"https://euw1.api.riotgames.com/"
-                f"lol/summoner/v4/summoners/by-puuid/{puuid}"
-            )
-            data = await self.api._safe_get(session, url)
-            if not data:
-                self.log(f"⚠️  Could not verify new player {puuid}")
-                return False
-
-            self.db.conn.execute(
-                "INSERT OR IGNORE INTO players(puuid, last_scraped) VALUES(?,?)",
-                (puuid, time.time()),
-            )
-            self.db.conn.commit()
-            self.log(f"🟢 Added new player {data.get('name','?')} ({puuid[:8]}...)")
-            return True
+        session = self.api.session()
+        url = (
+            f"https://euw1.api.riotgames.com/"
+            f"lol/summoner/v4/summoners/by-puuid/{puuid}"
+        )
+        data = await self.api._safe_get(session, url)
+        if not data:
+            self.log(f"⚠️  Could not verify new player {puuid}")
+            return False
+
+        self.db.conn.execute(
+            "INSERT OR IGNORE INTO players(puuid, last_scraped) VALUES(?,?)",
+            (puuid, time.time()),
+        )
+        self.log(f"🟢 Added new player {data.get('name','?')} ({puuid[:8]}...)")
+        return True
 
     async def seed_players(self, tiers=None):
         """
@@ -112,22 +127,22 @@ class MatchBase:
         """
         tiers = tiers or ["challenger", "grandmaster", "master"]
 
-        async with aiohttp.ClientSession() as session:
-            all_puuids = []
-            for tier in tiers:
-                self.log(f"Fetching {tier.title()} ladder...")
-                puuids = await self.api.get_ladder_puuids(session, tier)
-                all_puuids.extend(puuids)
+        session = self.api.session()
+        all_puuids = []
+        for tier in tiers:
+            self.log(f"Fetching {tier.title()} ladder...")
+            puuids = await self.api.get_ladder_puuids(session, tier)
+            all_puuids.extend(puuids)
 
-            # Deduplicate while keeping order
-            seen, ordered = set(), []
-            for p in all_puuids:
-                if p not in seen:
-                    seen.add(p)
-                    ordered.append(p)
+        # Deduplicate while keeping order
+        seen, ordered = set(), []
+        for p in all_puuids:
+            if p not in seen:
+                seen.add(p)
+                ordered.append(p)
 
-            for p in ordered:
-                self.db.insert_player(p)
+        with self.db.txn():
+            self.db.insert_players_bulk([(p, None, 0) for p in ordered])
 
         count = self.db.conn.execute("SELECT COUNT(*) FROM players").fetchone()[0]
         self.log(f"✅  Seeded {count} players across: {', '.join(tiers)}")
@@ -140,28 +155,42 @@ class MatchBase:
         Refresh one player's recent matches using minimal API calls.
 
         Steps:
-            1. Request last 10 match IDs.
+            1. Request up to 10 match IDs since the newest game from their own list
+               (none recorded yet → plain last‑10 fetch).
             2. For unseen IDs → fetch match details & insert player stats.
             3. Trim records to the newest 10.
         """
-        async with aiohttp.ClientSession() as session:
-            ids = await self.api.get_match_ids(session, puuid, count=10)
-            if not ids:
-                return 0
-
-            new_count = 0
-            for mid in ids:
-                # Skip if already stored for this player
-                cur = self.db.conn.execute(
-                    "SELECT 1 FROM player_match_stats WHERE puuid=? AND match_id=?",
-                    (puuid, mid),
-                )
-                if cur.fetchone():
-                    continue
-
-                match = await self.api.get_match_detail(session, mid)
-                if not match or "info" not in match:
-                    continue
+        session = self.api.session()
+        # Let Riot drop games we already hold; stored_match_ids still guards
+        # the boundary game, which startTime includes
+        last_ts = self.db.last_match_ts(puuid)
+        ids = await self.api.get_match_ids(
+            session, puuid, count=10,
+            start_time=int(last_ts // 1000) if last_ts else None,
+        )
+        if not ids:
+            return 0
+
+        # Fetch first, then write everything in one transaction so the
+        # write lock is never held across network awaits
+        # Skip ids already stored for this player (one query, not one per id)
+        stored = self.db.stored_match_ids(puuid, ids)
+        unseen = [mid for mid in ids if mid not in stored]
+        details = await asyncio.gather(
+            *(self.api.get_match_detail(session, mid) for mid in unseen)
+        )
+        fetched = [
+            (mid, match) for mid, match in zip(unseen, details)
+            if match and "info" in match
+        ]
+
+        new_count = 0
+        # last_match_ts only moves on games from this player's own id list;
+        # ids already stored (seen as someone else's participant) count too
+        newest_ts = max(filter(None, stored.values()), default=None)
+        stat_rows = []
+        with self.db.txn():
+            for mid, match in fetched:
                 info = match["info"]
                 metadata = match.get("metadata", {})
 
@@ -182,37 +211,35 @@ class MatchBase:
                     if not part_puuid:
                         continue
 
-                    stats_payload = {
-                        "kills": part.get("kills", 0),
-                        "deaths": part.get("deaths", 0),
-                        "assists": part.get("assists", 0),
-                        "gold": part.get("goldEarned", 0),
-                        "damage": part.get("totalDamageDealtToChampions", 0),
-                        "vision": part.get("visionScore", 0),
-                    }
-
-                    self.db.insert_player_match(
+                    stat_rows.append((
                         part_puuid,
                         mid,
                         match_ts,
                         part.get("teamPosition"),
-                        stats_payload,
-                    )
+                        {key: part.get(src, 0) for key, src in STATS_FIELDS},
+                    ))
 
                     if part_puuid == puuid:
                         target_inserted = True
 
                 if target_inserted:
                     new_count += 1
+                    if "gameStartTimestamp" in info:
+                        newest_ts = max(newest_ts or 0, info["gameStartTimestamp"])
+
+            # every participant row of every new match in one executemany
+            self.db.insert_player_matches_bulk(stat_rows)
 
-            # Keep only the last 10 matches
+            # Keep only the last 10 matches
             self.db.delete_old_matches(puuid, keep=10)
             self.db.mark_scraped(puuid)
-            if new_count:
-                self.log(f"Updated {puuid[:8]}… (+{new_count} new)")
-            return new_count
+            if newest_ts:
+                self.db.bump_last_match_ts(puuid, newest_ts)
+        if new_count:
+            self.log(f"Updated {puuid[:8]}… (+{new_count} new)")
+        return new_count
 
-    async def update_all_players(self, limit=None):
+    async def update_all_players(self, limit=None, concurrency=10):
         """
         Iterate through all tracked players and update them.
         Optionally limit for testing.
@@ -222,7 +249,15 @@ class MatchBase:
         if limit:
             players = players[:limit]
 
-        for puuid in players:
+        # Players run concurrently; RiotAPIClient.sem still caps requests in
+        # flight, this only bounds how many players hold fetched matches
+        player_sem = asyncio.Semaphore(concurrency)
+        await asyncio.gather(
+            *(self._guarded_update(puuid, player_sem) for puuid in players)
+        )
+
+    async def _guarded_update(self, puuid, sem):
+        async with sem:
             try:
                 await self.update_player(puuid)
             except Exception as e:
@@ -232,17 +267,35 @@ class MatchBase:
     # --- Dual‑DB management -------------------------------------- #
     # ------------------------------------------------------------- #
     def copy_live_db(self):
-        """Duplicate live → update DB safely."""
-        if os.path.exists(self.update_path):
-            os.remove(self.update_path)
-        shutil.copy(self.live_path, self.update_path)
+        """Duplicate live → update DB with SQLite's online backup (self.db must be on live)."""
+        self._remove_db_files(self.update_path)
+        dst = sqlite3.connect(self.update_path)
+        try:
+            # page‑level copy in 1024‑page steps; writers may continue between steps
+            self.db.conn.backup(dst, pages=1024)
+        finally:
+            dst.close()
         self.log("💾  Copied live → update DB")
 
+    @staticmethod
+    def _remove_db_files(path):
+        """Delete a DB and its WAL sidecars so a stale -wal is never replayed onto a new copy."""
+        for p in (path, f"{path}-wal", f"{path}-shm"):
+            if os.path.exists(p):
+                os.remove(p)
+
     def promote_update_db(self):
-        """Replace live DB with fully updated copy."""
-        if os.path.exists(self.live_path):
-            os.remove(self.live_path)
-        shutil.copy(self.update_path, self.live_path)
+        """
+        Replace live DB with fully updated copy (self.db must be on the update DB).
+        The checkpoint makes the update file self‑contained, then an atomic
+        rename swaps it in, so readers see either the old or the new DB.
+        """
+        self.db.analyze()
+        self.db.checkpoint()
+        for p in (f"{self.live_path}-wal", f"{self.live_path}-shm"):
+            if os.path.exists(p):
+                os.remove(p)
+        os.replace(self.update_path, self.live_path)
         self.log("🚀  Promoted update → live DB")
 
     # ------------------------------------------------------------- #
@@ -262,12 +315,19 @@ class MatchBase:
             os.remove(self.live_path)
         self.db = DatabaseHandler(self.live_path)
 
-        # Step 1 — Seed only Challenger tier
-        await self.seed_players(tiers=["challenger"])
-
-        # Step 2 — Full update (all 300 players)
-        await self.update_all_players()
-
-        # Step 3 — Compute normalization metadata
-        self.compute_level_bounds()
+        # A fresh build can simply be rerun if it dies, so skip fsyncs until done
+        self.db.conn.execute("PRAGMA synchronous=OFF")
+        try:
+            # Step 1 — Seed only Challenger tier
+            await self.seed_players(tiers=["challenger"])
+
+            # Step 2 — Full update (all 300 players)
+            await self.update_all_players()
+
+            # Step 3 — Compute normalization metadata
+            self.compute_level_bounds()
+            self.db.analyze()
+        finally:
+            self.db.conn.execute("PRAGMA synchronous=NORMAL")
+            self.db.checkpoint()
         self.log("✅  Full Challenger build complete.")
\ No newline at end of file
@@ -1,4 +1,6 @@
 import asyncio, aiohttp, os
+import orjson
+from collections import OrderedDict
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,25 +13,106 @@ ROUTING_REGION  = "europe"
 class RiotAPIClient:
     """Asynchronous Riot API wrapper with basic throttling and back‑off."""
 
-    def __init__(self, sem_limit=5, cooldown=0.25):
+    # parsed match payloads are large; the cache only needs to span the
+    # players being updated concurrently, who share recent games
+    def __init__(self, sem_limit=5, cooldown=0.25, cache_size=64):
         self.sem = asyncio.Semaphore(sem_limit)
         self.cooldown = cooldown
+        self.cache_size = cache_size
+        self._cache = OrderedDict()   # url → Future, LRU order
+        self._session = None
+        self._session_loop = None
+
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Shared keep‑alive session so calls reuse TCP+TLS connections.
+        Created lazily inside the running loop and rebuilt if a later
+        asyncio.run() brings a new loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(
+                headers=HEADERS,
+                connector=aiohttp.TCPConnector(
+                    limit=32, limit_per_host=10, ttl_dns_cache=300
+                ),
+                timeout=aiohttp.ClientTimeout(total=15),
+            )
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
 
     async def _safe_get(self, session: aiohttp.ClientSession, url: str):
         """Perform GET with simple rate‑limit handling."""
-        async with self.sem:
-            async with session.get(url, headers=HEADERS) as r:
-                if r.status == 429:  # rate‑limit
-                    wait = int(r.headers.get("Retry-After", 2))
-                    print(f"⚠️ 429 – waiting {wait}s")
-                    await asyncio.sleep(wait)
-                    return await self._safe_get(session, url)
-                if r.status != 200:
-                    print(f"[WARN] {r.status} → {url}")
+        while True:
+            async with self.sem:
+                try:
+                    # auth headers come from the session; orjson decodes the
+                    # raw body without aiohttp's str round-trip
+                    async with session.get(url) as r:
+                        if r.status == 200:
+                            data = orjson.loads(await r.read())
+                            await asyncio.sleep(self.cooldown)
+                            return data
+                        if r.status != 429:
+                            print(f"[WARN] {r.status} → {url}")
+                            return None
+                        wait = int(r.headers.get("Retry-After", 2))
+                except (aiohttp.ClientError, asyncio.TimeoutError, orjson.JSONDecodeError) as e:
+                    # a stalled or dropped connection is treated like a failed status
+                    print(f"[WARN] {type(e).__name__} → {url}")
                     return None
-                data = await r.json()
-                await asyncio.sleep(self.cooldown)
-                return data
+            # rate‑limit: back off after releasing the semaphore so
+            # concurrent callers cannot deadlock on each other's slots
+            print(f"⚠️ 429 – waiting {wait}s")
+            await asyncio.sleep(wait)
+
+    async def cached_get(self, session: aiohttp.ClientSession, url: str):
+        """
+        _safe_get memoised by URL for immutable resources (match detail,
+        per‑player statics within a run). Concurrent callers for the same
+        URL share one in‑flight request; failed lookups are not cached.
+        """
+        fut = self._cache.get(url)
+        if fut is not None:
+            self._cache.move_to_end(url)
+            return await asyncio.shield(fut)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._cache[url] = fut
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        try:
+            data = await self._safe_get(session, url)
+        except BaseException as e:
+            self._evict(url, fut)
+            if isinstance(e, asyncio.CancelledError):
+                fut.cancel()
+            else:
+                fut.set_exception(e)
+                fut.exception()   # mark retrieved so an unawaited future stays quiet
+            raise
+        if data is None:
+            self._evict(url, fut)
+        fut.set_result(data)
+        return data
+
+    def _evict(self, url, fut):
+        """Drop a failed lookup so the next call retries it."""
+        # only this future's own entry: once LRU-evicted, a newer request
+        # may already hold the URL
+        if self._cache.get(url) is fut:
+            del self._cache[url]
 
     async def get_ladder_puuids(self, session: aiohttp.ClientSession, tier: str):
         """Retrieve PUUIDs from a specific ladder tier."""
@@ -58,14 +141,22 @@ class RiotAPIClient:
         print(f"✅ Total seed PUUIDs: {len(ordered)}")
         return ordered
 
-    async def get_match_ids(self, session, puuid: str, count: int = 5):
-        """Latest match IDs for a given PUUID."""
+    async def get_match_ids(self, session, puuid: str, count: int = 5,
+                            queue: int | None = None, start_time: int | None = None):
+        """
+        Latest match IDs for a given PUUID, optionally filtered to one queue
+        and to games since <start_time> (epoch seconds). None if the request
+        failed, so callers can tell it apart from a player with no games.
+        """
         url = (f"https://{ROUTING_REGION}.api.riotgames.com/"
                f"lol/match/v5/matches/by-puuid/{puuid}/ids?count={count}")
-        data = await self._safe_get(session, url)
-        return data or []
+        if queue is not None:
+            url += f"&queue={queue}"
+        if start_time is not None:
+            url += f"&startTime={start_time}"
+        return await self._safe_get(session, url)
 
     async def get_match_detail(self, session, match_id: str):
         """Full match detail JSON."""
         url = f"https://{ROUTING_REGION}.api.riotgames.com/lol/match/v5/matches/{match_id}"
-        return await self._safe_get(session, url)
\ No newline at end of file
+        return await self.cached_get(session, url)
\ No newline at end of file
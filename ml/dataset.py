@@ -1,6 +1,12 @@
-import json, random, sqlite3, torch
+import math, random, sqlite3
+
+import numpy as np
+import orjson
+import torch
 from torch.utils.data import Dataset, random_split
 
+from core.dynamic_vec import unpack_dynamic
+
 
 # ---------------------------------------------------------------------
 # Helpers
@@ -8,37 +14,48 @@ from torch.utils.data import Dataset, random_split
 
 def safe_num(x):
     try:
-        if x is None or (isinstance(x, float) and torch.isnan(torch.tensor(x))):
+        if x is None or (isinstance(x, float) and math.isnan(x)):
             return 0.0
         return float(x)
     except Exception:
         return 0.0
 
 
-def build_player_vector(static_json, dynamic_json):
-    """Combine static+dynamic JSON into 13‑feature numeric vector."""
-    s = json.loads(static_json)
-    d = json.loads(dynamic_json)
+def build_player_vector(static_json, dynamic_json, dynamic_vec=None):
+    """Combine static JSON + packed dynamic vector into a 13‑feature float32 array."""
+    s = orjson.loads(static_json)
+    # rows written before dynamic_vec existed still carry dynamic_json
+    if dynamic_vec is not None:
+        d = unpack_dynamic(dynamic_vec)
+    else:
+        d = orjson.loads(dynamic_json)
     rank_map = {"IV": 1, "III": 2, "II": 3, "I": 4}
     rank_strength = safe_num(rank_map.get(s.get("rank"), 0)) * safe_num(
         s.get("league_points")
     )
 
-    feats = [
-        safe_num(s.get("tier_norm")),
+    vals = [
+        s.get("tier_norm"),
         rank_strength,
-        safe_num(s.get("summoner_level")),
-        safe_num(s.get("mastery_score")),
-        safe_num(s.get("challenge_points")),
-        safe_num(d.get("kills_avg")),
-        safe_num(d.get("deaths_avg")),
-        safe_num(d.get("assists_avg")),
-        safe_num(d.get("gold_per_min")),
-        safe_num(d.get("cs_per_min")),
-        safe_num(d.get("vision_score")),
-        safe_num(d.get("damage_to_champs")),
-        safe_num(d.get("win_rate_recent")),
+        s.get("summoner_level"),
+        s.get("mastery_score"),
+        s.get("challenge_points"),
+        d.get("kills_avg"),
+        d.get("deaths_avg"),
+        d.get("assists_avg"),
+        d.get("gold_per_min"),
+        d.get("cs_per_min"),
+        d.get("vision_score"),
+        d.get("damage_to_champs"),
+        d.get("win_rate_recent"),
     ]
+    # one C-level conversion (None -> NaN -> 0) instead of 13 safe_num
+    # frames; only rows holding non-numeric junk take the scalar path
+    try:
+        feats = np.array(vals, dtype=np.float32)
+    except (TypeError, ValueError):
+        return np.array([safe_num(v) for v in vals], dtype=np.float32)
+    feats[np.isnan(feats)] = 0.0
     return feats
 
 
@@ -55,55 +72,69 @@ class MatchDataset(Dataset):
 
     def __init__(self, db_path, seed=42):
         self.conn = sqlite3.connect(db_path)
-        self.samples = self._load_all_matches()
+        X, y = self._load_all_matches()
         self.conn.close()
 
         # shuffle right after loading
+        order = list(range(len(X)))
         random.seed(seed)
-        random.shuffle(self.samples)
+        random.shuffle(order)
+        self.X = torch.from_numpy(X[order])
+        self.y = torch.from_numpy(y[order])
 
     def _load_all_matches(self):
+        # JSON columns come back as bytes (CAST AS BLOB): orjson parses them
+        # as-is, skipping the str decode sqlite3 would otherwise do per row
         rows = self.conn.execute(
-            "SELECT match_id, puuids_json, label, vector_complete FROM matches"
+            "SELECT match_id, CAST(puuids_json AS BLOB), label FROM matches "
+            "WHERE vector_complete=1"
         ).fetchall()
 
-        samples = []
-        for match_id, puuids_json, label, complete in rows:
-            if not complete:
-                continue
+        # one pass over player_features; players recur across many matches,
+        # so each vector is built on first sight and reused after that
+        features = {
+            puuid: (sj, dj, dv)
+            for puuid, sj, dj, dv in self.conn.execute(
+                "SELECT puuid, CAST(static_json AS BLOB), "
+                "CAST(dynamic_json AS BLOB), dynamic_vec FROM player_features"
+            )
+        }
+        vec_cache = {}
+
+        # filled in place, trimmed to the matches that survive the checks
+        X_all = np.empty((len(rows), 10, 13), dtype=np.float32)
+        y_all = np.empty((len(rows), 1), dtype=np.float32)
+        n = 0
+        for match_id, puuids_json, label in rows:
             try:
-                puuids = json.loads(puuids_json)
+                puuids = orjson.loads(puuids_json)
             except Exception:
                 continue
             if len(puuids) != 10:
                 continue
 
-            all_vecs = []
-            skip = False
-            for puuid in puuids:
-                row = self.conn.execute(
-                    "SELECT static_json, dynamic_json FROM player_features WHERE puuid=?",
-                    (puuid,),
-                ).fetchone()
-                if not row:
-                    skip = True
-                    break
-                all_vecs.append(build_player_vector(*row))
-            if skip or len(all_vecs) != 10:
+            try:
+                all_vecs = []
+                for p in puuids:
+                    vec = vec_cache.get(p)
+                    if vec is None:
+                        vec = vec_cache[p] = build_player_vector(*features[p])
+                    all_vecs.append(vec)
+            except KeyError:
                 continue
 
-            X = torch.tensor(all_vecs, dtype=torch.float32)
-            y = torch.tensor([safe_num(label)], dtype=torch.float32)
-            samples.append((X, y))
+            X_all[n] = all_vecs
+            y_all[n, 0] = safe_num(label)
+            n += 1
 
-        print(f"Loaded {len(samples)} complete matches.")
-        return samples
+        print(f"Loaded {n} complete matches.")
+        return X_all[:n], y_all[:n]
 
     def __len__(self):
-        return len(self.samples)
+        return len(self.X)
 
     def __getitem__(self, idx):
-        return self.samples[idx]
+        return self.X[idx], self.y[idx]
 
 
 # ---------------------------------------------------------------------
@@ -121,8 +152,10 @@ def prepare_splits(db_path, out_dir="data", seed=42):
     train, dev, test = random_split(ds, [n_train, n_dev, n_test])
 
     def save_split(name, split):
-        X = torch.stack([x for x, _ in split])
-        y = torch.stack([y for _, y in split])
+        # one gather per tensor; indexing with a tensor skips the list walk
+        idx = torch.as_tensor(split.indices, dtype=torch.long)
+        X = ds.X[idx]
+        y = ds.y[idx]
         cpu_path = f"{out_dir}/{name}_cpu.pt"
         torch.save((X, y), cpu_path)
         if torch.cuda.is_available():
@@ -1,7 +1,9 @@
 # ml/models/moe_transformer_deep.py
 import torch
 import torch.nn as nn
-import math
+from torch.nn.functional import scaled_dot_product_attention as sdpa
+
+from .moe_transformer import fuse_legacy_qkv, init_qkv
 
 # -------------------------------------------------------------
 # single attention + FFN sub‑block
@@ -12,9 +14,8 @@ class AttnBlock(nn.Module):
         self.n_heads = n_heads
         self.d_model = d_model
 
-        self.qs = nn.ModuleList([nn.Linear(n_feat, d_model) for _ in range(n_heads)])
-        self.ks = nn.ModuleList([nn.Linear(n_feat, d_model) for _ in range(n_heads)])
-        self.vs = nn.ModuleList([nn.Linear(n_feat, d_model) for _ in range(n_heads)])
+        # all heads' Q/K/V in one Linear
+        self.qkv = nn.Linear(n_feat, 3 * n_heads * d_model)
 
         # gating on raw input features (13)
         self.gate = nn.Sequential(
@@ -38,17 +39,14 @@ class AttnBlock(nn.Module):
     def forward(self, x):                            # x:(B,10,n_feat)
         B = x.size(0)
 
-        # --- Multi‑head attention with MoE gating
-        heads_out = []
-        for q, k, v in zip(self.qs, self.ks, self.vs):
-            Q, K, V = q(x), k(x), v(x)
-            attn = torch.bmm(Q, K.transpose(1,2)) / math.sqrt(Q.size(-1))
-            attn = torch.softmax(attn, dim=2)
-            heads_out.append(torch.bmm(attn, V))
+        # --- Multi‑head attention with MoE gating, batched over heads
+        qkv = self.qkv(x).view(B, 10, 3, self.n_heads, self.d_model)
+        Q, K, V = qkv.permute(2, 0, 3, 1, 4)                          # each (B,n_heads,10,d_model)
+        heads_out = sdpa(Q, K, V)                                     # (B,n_heads,10,d_model)
 
-        gate_w = self.gate(x.mean(dim=1)).unsqueeze(1).unsqueeze(-1)  # (B,1,n_heads,1)
-        heads_out = torch.stack(heads_out, dim=2) * gate_w            # (B,10,n_heads,d_model)
-        heads_out = heads_out.view(B, 10, -1)                         # (B,10,n_heads*d_model)
+        gate_w = self.gate(x.mean(dim=1)).view(B, self.n_heads, 1, 1)
+        heads_out = heads_out * gate_w
+        heads_out = heads_out.transpose(1, 2).reshape(B, 10, -1)      # (B,10,n_heads*d_model)
 
         out = self.proj(heads_out)                                    # (B,10,d_model)
         x = self.norm1(out + x)                                       # residual
@@ -56,6 +54,10 @@ class AttnBlock(nn.Module):
         x = self.norm2(x + self.dropout(f))
         return x
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        fuse_legacy_qkv(state_dict, prefix, self.n_heads)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
 
 # -------------------------------------------------------------
 # 4‑layer deep attention model
@@ -63,14 +65,14 @@ class AttnBlock(nn.Module):
 class MatchAttnMoEDeep(nn.Module):
     def __init__(self, n_feat=13, d_model=64, n_heads=16, n_layers=16, dropout=0.03):
         super().__init__()
-        self.input_bn = nn.BatchNorm1d(10)
+        self.input_ln = nn.LayerNorm(n_feat)
         self.input_proj = nn.Linear(n_feat, d_model)
         self.layers = nn.ModuleList([
             AttnBlock(d_model, d_model=d_model, n_heads=n_heads, dropout=dropout)
             for _ in range(n_layers)
         ])
 
-        self.output_bn = nn.BatchNorm1d(10)
+        self.output_ln = nn.LayerNorm(d_model)
         self.output_drop = nn.Dropout(dropout)
         self.fc1 = nn.Linear(10 * d_model, 512)
         self.bn1 = nn.BatchNorm1d(512)
@@ -79,6 +81,8 @@ class MatchAttnMoEDeep(nn.Module):
         self.out = nn.Sigmoid()
 
         self.apply(self._init_xavier)
+        for blk in self.layers:
+            init_qkv(blk.qkv, blk.n_heads)
 
     def _init_xavier(self, m):
         if isinstance(m, nn.Linear):
@@ -87,13 +91,13 @@ class MatchAttnMoEDeep(nn.Module):
                 nn.init.zeros_(m.bias)
 
     def forward(self, x):                           # (B,10,13)
-        x = self.input_bn(x)
+        x = self.input_ln(x)
         x = self.input_proj(x)                      # (B,10,d_model)
 
         for blk in self.layers:
             x = blk(x)                              # stacked blocks
 
-        x = self.output_bn(x)
+        x = self.output_ln(x)
         x = self.output_drop(x)
         flat = x.flatten(start_dim=1)
         h = self.act(self.bn1(self.fc1(flat)))
@@ -1,6 +1,6 @@
 import torch
 import torch.nn as nn
-import math
+from torch.nn.functional import scaled_dot_product_attention as sdpa
 
 class MatchAttnMoEModel(nn.Module):
     def __init__(self, n_feat=13, d_model=128, n_heads=4, dropout=0.05):
@@ -13,10 +13,8 @@ class MatchAttnMoEModel(nn.Module):
         self.bn_out = nn.BatchNorm1d(10)
         self.dropout = nn.Dropout(dropout)
 
-        # Multi‑head attention projections
-        self.qs = nn.ModuleList([nn.Linear(n_feat, d_model) for _ in range(n_heads)])
-        self.ks = nn.ModuleList([nn.Linear(n_feat, d_model) for _ in range(n_heads)])
-        self.vs = nn.ModuleList([nn.Linear(n_feat, d_model) for _ in range(n_heads)])
+        # Multi‑head attention projections, all heads' Q/K/V in one Linear
+        self.qkv = nn.Linear(n_feat, 3 * n_heads * d_model)
 
         # Gating network for heads (Mixture of Experts weighting)
         self.gate = nn.Sequential(
@@ -36,28 +34,25 @@ class MatchAttnMoEModel(nn.Module):
 
         # xavier init
         self.apply(init_xavier)
+        init_qkv(self.qkv, n_heads)
 
     def forward(self, x):  # x: (B,10,13)
         B = x.size(0)
         x = self.bn_in(x)
 
-        # attention heads
-        heads_out = []
-        for q, k, v in zip(self.qs, self.ks, self.vs):
-            Q, K, V = q(x), k(x), v(x)
-            scores = torch.bmm(Q, K.transpose(1, 2)) / math.sqrt(Q.size(-1))
-            weights = torch.softmax(scores, dim=2)
-            heads_out.append(torch.bmm(weights, V))  # (B,10,d_model)
+        # attention heads, batched over the head dimension
+        qkv = self.qkv(x).view(B, 10, 3, self.n_heads, self.d_model)
+        Q, K, V = qkv.permute(2, 0, 3, 1, 4)        # each (B,n_heads,10,d_model)
+        heads_out = sdpa(Q, K, V)                   # (B,n_heads,10,d_model)
 
         # calculate MoE gate weights per batch
         mean_in = x.mean(dim=1)               # (B, n_feat)
         gate_w = self.gate(mean_in)           # (B, n_heads)
-        gate_w = gate_w.unsqueeze(1).unsqueeze(-1)  # (B,1,n_heads,1)
+        gate_w = gate_w.view(B, self.n_heads, 1, 1)
 
         # blend heads by their gate weights before concatenation
-        heads_out = torch.stack(heads_out, dim=2)   # (B,10,n_heads,d_model)
         heads_out = heads_out * gate_w
-        heads_out = heads_out.view(B, 10, -1)       # (B,10,n_heads*d_model)
+        heads_out = heads_out.transpose(1, 2).reshape(B, 10, -1)  # (B,10,n_heads*d_model)
 
         # projection + norm + dropout
         proj = self.proj(heads_out)
@@ -69,6 +64,10 @@ class MatchAttnMoEModel(nn.Module):
         h = self.act(self.bn_fc1(self.fc1(flat)))
         y = self.out(self.fc2(h))                   # (B,1)
         return y
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        fuse_legacy_qkv(state_dict, prefix, self.n_heads)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
     
 def init_xavier(m):
     if isinstance(m, nn.Linear):
@@ -76,6 +75,22 @@ def init_xavier(m):
         if m.bias is not None:
             nn.init.zeros_(m.bias)
 
+def init_qkv(linear, n_heads):
+    """Xavier-init each (d_model, n_feat) head slice as if it were its own Linear."""
+    for w in linear.weight.data.view(3 * n_heads, -1, linear.in_features):
+        nn.init.xavier_uniform_(w)
+
+def fuse_legacy_qkv(state_dict, prefix, n_heads):
+    """Rewrite per-head qs/ks/vs checkpoint entries into the fused qkv layout."""
+    if f"{prefix}qs.0.weight" not in state_dict:
+        return
+    for param in ("weight", "bias"):
+        state_dict[f"{prefix}qkv.{param}"] = torch.cat([
+            state_dict.pop(f"{prefix}{name}.{h}.{param}")
+            for name in ("qs", "ks", "vs")
+            for h in range(n_heads)
+        ])
+
 def count_params(model):
     total = sum(p.numel() for p in model.parameters())
     trainable = sum(p.numel() for p in model.parameters() if p.requires_grad)
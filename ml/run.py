@@ -1,7 +1,8 @@
 # ml/run.py
 import torch, os, json, shutil
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+import torch.distributed as dist
 from torch import nn
 from torch.utils.data import DataLoader, TensorDataset
 from models.mlp import MatchMLPBaseline
@@ -12,41 +13,119 @@ from models.moe_attn_deep import MatchAttnMoEDeep
 # -------------------------------------------------------------
 # Utility helpers
 # -------------------------------------------------------------
-def load_split(path):
+def load_split(path, device="cpu"):
     X, y = torch.load(path, map_location="cpu")
-    return TensorDataset(X, y)
+    return TensorDataset(X.to(device), y.to(device))
+
+class DeviceBatches:
+    """Batches sliced straight from tensors that already live on the device."""
+
+    def __init__(self, dataset, bs, shuffle):
+        self.dataset = dataset
+        self.bs = bs
+        self.shuffle = shuffle
+
+    def __iter__(self):
+        X, y = self.dataset.tensors
+        if self.shuffle:
+            perm = torch.randperm(len(X), device=X.device)
+            for i in range(0, len(X), self.bs):
+                idx = perm[i:i + self.bs]
+                yield X[idx], y[idx]
+        else:
+            for i in range(0, len(X), self.bs):
+                yield X[i:i + self.bs], y[i:i + self.bs]
+
+def amp_dtype(device, use_amp=False):
+    """BF16 on GPUs that support it, FP16 on older ones, None for FP32."""
+    if not use_amp or device != "cuda":
+        return None
+    return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+
+def autocast(device, dtype):
+    """Autocast context for amp_dtype's choice; a no-op when dtype is None."""
+    return torch.autocast(device_type=device, dtype=dtype or torch.bfloat16,
+                          enabled=dtype is not None)
+
+def make_loader(data, bs, shuffle, hypers):
+    """
+    GPU-resident splits are batched in place; CPU splits go through a
+    DataLoader with optional persistent workers taken from hypers.
+    """
+    if data.tensors[0].is_cuda:
+        return DeviceBatches(data, bs, shuffle)
+    workers = hypers.get("num_workers", 0)
+    kw = {}
+    if workers > 0:
+        kw = {"persistent_workers": True,
+              "prefetch_factor": min(hypers.get("prefetch_factor", 2), 4)}
+    return DataLoader(data, bs, shuffle=shuffle, num_workers=workers, **kw)
+
+def init_dist():
+    """
+    Rank and world size from torchrun's env vars (0 / 1 when run plainly).
+    Each rank is pinned to its own GPU so "cuda" means that device.
+    """
+    rank = int(os.environ.get("RANK", 0))
+    world = int(os.environ.get("WORLD_SIZE", 1))
+    if torch.cuda.is_available():
+        torch.cuda.set_device(int(os.environ.get("LOCAL_RANK", 0)))
+    if world > 1 and not dist.is_initialized():
+        dist.init_process_group("nccl" if torch.cuda.is_available() else "gloo")
+    return rank, world
 
 def count_params(model):
     return sum(p.numel() for p in model.parameters() if p.requires_grad)
 
 def plot_curves(hist, out_path):
-    plt.figure()
-    plt.plot(hist["train_loss"], label="train")
-    plt.plot(hist["val_loss"], label="val")
-    plt.xlabel("epoch"); plt.ylabel("MSE")
-    plt.title("Loss Curves")
-    plt.legend(); plt.tight_layout()
-    plt.savefig(out_path); plt.close()
+    # a bare Figure renders through Agg without pyplot's GUI backend/registry
+    fig = Figure()
+    ax = fig.add_subplot()
+    ax.plot(hist["train_loss"], label="train")
+    ax.plot(hist["val_loss"], label="val")
+    ax.set_xlabel("epoch"); ax.set_ylabel("MSE")
+    ax.set_title("Loss Curves")
+    ax.legend(); fig.tight_layout()
+    fig.savefig(out_path)
 
 
 # -------------------------------------------------------------
 # Training / evaluation
 # -------------------------------------------------------------
-def evaluate(model, loader, device, criterion):
-    model.eval(); total = 0.0
+def evaluate(model, loader, device, criterion, dtype=None):
+    # accumulate on the device; one .item() sync per pass instead of per batch
+    model.eval(); total = torch.zeros((), device=device)
     with torch.no_grad():
         for X, y in loader:
-            X, y = X.to(device), y.to(device)
-            total += criterion(model(X), y).item() * X.size(0)
-    return total / len(loader.dataset)
+            X, y = X.to(device, non_blocking=True), y.to(device, non_blocking=True)
+            with autocast(device, dtype):
+                total += criterion(model(X), y).float() * X.size(0)
+    return (total / len(loader.dataset)).item()
 
 
 def train_one(model, train_loader, val_loader, device, lr, wd,
-              max_epochs=100, patience=25):
+              max_epochs=100, patience=25, use_amp=False, use_compile=False,
+              accum_steps=1):
+    """
+    accum_steps > 1 steps the optimizer every accum_steps micro-batches, so
+    the effective batch (and the lr it pairs with) grows by that factor.
+    """
 
     model.to(device)
+    # compiled handle for the hot loop; model itself keeps the plain
+    # state_dict keys (torch.compile would prefix them with _orig_mod.)
+    fwd = model
+    if use_compile and device == "cuda":
+        # default mode: each trial compiles a fresh model, so autotuning and
+        # CUDA-graph capture would cost more than this small net trains for;
+        # the default dynamic=None turns the batch dim symbolic after the
+        # ragged last batch instead of specialising on every shape
+        fwd = torch.compile(model)
     criterion = nn.MSELoss()
     optim = torch.optim.Adam(model.parameters(), lr=lr, weight_decay=wd)
+    # BF16 keeps FP32's exponent range; only FP16 needs loss scaling
+    dtype = amp_dtype(device, use_amp)
+    scaler = torch.amp.GradScaler(device, enabled=dtype == torch.float16)
     best_val = float("inf")
     best_state = None
     hist = {"train_loss": [], "val_loss": []}
@@ -54,23 +133,35 @@ def train_one(model, train_loader, val_loader, device, lr, wd,
 
     for e in range(max_epochs):
         model.train()
-        tloss = 0.0
-        for X, y in train_loader:
-            X, y = X.to(device), y.to(device)
-            optim.zero_grad()
-            l = criterion(model(X), y)
-            l.backward()
-            optim.step()
-            tloss += l.item() * X.size(0)
-        tloss /= len(train_loader.dataset)
-        vloss = evaluate(model, val_loader, device, criterion)
+        tloss = torch.zeros((), device=device)
+        optim.zero_grad(set_to_none=True)
+        i = 0
+        for i, (X, y) in enumerate(train_loader, 1):
+            X, y = X.to(device, non_blocking=True), y.to(device, non_blocking=True)
+            with autocast(device, dtype):
+                l = criterion(fwd(X), y)
+            scaler.scale(l / accum_steps).backward()
+            if i % accum_steps == 0:
+                scaler.step(optim)
+                scaler.update()
+                optim.zero_grad(set_to_none=True)
+            tloss += l.detach().float() * X.size(0)
+        if i % accum_steps:
+            # flush the epoch's trailing partial accumulation
+            scaler.step(optim)
+            scaler.update()
+        tloss = (tloss / len(train_loader.dataset)).item()
+        vloss = evaluate(fwd, val_loader, device, criterion, dtype)
         hist["train_loss"].append(tloss)
         hist["val_loss"].append(vloss)
         print(f"Epoch {e+1:03d}: train={tloss:.5f}  val={vloss:.5f}")
 
         if vloss < best_val:
             best_val = vloss
-            best_state = model.state_dict()
+            # CPU snapshot: state_dict() alone aliases the live weights, which
+            # later epochs would overwrite before the final load_state_dict
+            best_state = {k: v.detach().to("cpu", copy=True)
+                          for k, v in model.state_dict().items()}
             wait = 0
         else:
             wait += 1
@@ -86,9 +177,17 @@ def train_one(model, train_loader, val_loader, device, lr, wd,
 # Run manager / hyper‑parameter search
 # -------------------------------------------------------------
 def run_experiment(model_cls, run_prefix, hypers):
+    # under torchrun every rank takes every world-th trial of the grid
+    rank, world = init_dist()
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    train_data = load_split("data/train_cpu.pt")
-    dev_data   = load_split("data/dev_cpu.pt")
+    # TF32 tensor cores for whatever stays FP32 outside autocast (Ampere+);
+    # shapes are fixed per trial, so cuDNN can keep its autotuned choice
+    torch.set_float32_matmul_precision("high")
+    torch.backends.cudnn.allow_tf32 = True
+    torch.backends.cudnn.benchmark = True
+    # the splits are small enough to sit on the GPU for the whole search
+    train_data = load_split("data/train_cpu.pt", device)
+    dev_data   = load_split("data/dev_cpu.pt", device)
 
     best_overall = {"best_val": float("inf")}
     run_id = 0
@@ -98,6 +197,8 @@ def run_experiment(model_cls, run_prefix, hypers):
         for lr in hypers["lr"]:
             for wd in hypers["weight_decay"]:
                 run_id += 1
+                if (run_id - 1) % world != rank:
+                    continue
                 run_name = f"{run_prefix}_{run_id:03d}"
                 run_dir  = os.path.join("runs", run_name)
                 os.makedirs(run_dir, exist_ok=True)
@@ -109,12 +210,14 @@ def run_experiment(model_cls, run_prefix, hypers):
                 model = model_cls()
                 print(f"   parameters={count_params(model):,}")
 
-                train_loader = DataLoader(train_data, bs, shuffle=True)
-                val_loader   = DataLoader(dev_data,  bs, shuffle=False)
+                train_loader = make_loader(train_data, bs, True, hypers)
+                val_loader   = make_loader(dev_data,  bs, False, hypers)
 
                 best_val, hist, trained = train_one(
                     model, train_loader, val_loader, device,
-                    lr=lr, wd=wd
+                    lr=lr, wd=wd, use_amp=hypers.get("use_amp", False),
+                    use_compile=hypers.get("use_compile", False),
+                    accum_steps=hypers.get("accum_steps", 1)
                 )
 
                 pd.DataFrame(hist).to_csv(f"{run_dir}/history.csv", index=False)
@@ -131,11 +234,29 @@ def run_experiment(model_cls, run_prefix, hypers):
 
                 if best_val < best_overall["best_val"]:
                     best_overall = meta.copy()
-                    best_overall["state_dict"] = trained.state_dict()
+                    best_overall["state_dict"] = {
+                        k: v.detach().cpu() for k, v in trained.state_dict().items()
+                    }
                     print(f"🌟 New best run: {run_name} (val={best_val:.5f})")
 
+                # release this trial's weights/optimizer state before the next
+                del model, trained, train_loader, val_loader
+                if device == "cuda":
+                    torch.cuda.empty_cache()
+
+    # collect every rank's trials; rank 0 alone writes the summary + weights
+    if world > 1:
+        gathered = [None] * world
+        dist.all_gather_object(gathered, (results, best_overall))
+        dist.destroy_process_group()
+        if rank != 0:
+            return
+        results = sorted((m for r, _ in gathered for m in r), key=lambda m: m["run"])
+        best_overall = min((b for _, b in gathered), key=lambda b: b["best_val"])
+
     # save only best overall
     os.makedirs("weights", exist_ok=True)
+    os.makedirs("runs", exist_ok=True)
     best_name = best_overall["run"]
     best_w_path = f"weights/{best_name}.pt"
     torch.save(best_overall["state_dict"], best_w_path)
@@ -180,7 +301,17 @@ if __name__ == "__main__":
     hypers = {
         "batch_size": [16],
         "lr": [0.0004],
-        "weight_decay": [0.0003]
+        "weight_decay": [0.0003],
+        # use_amp runs forwards under BF16/FP16 autocast on CUDA;
+        # use_compile wraps the forward in torch.compile (CUDA only)
+        "use_amp": False,
+        "use_compile": False,
+        # accum_steps > 1 steps the optimizer every N micro-batches
+        # (effective batch = batch_size * accum_steps)
+        "accum_steps": 1,
+        # num_workers > 0 loads batches in worker processes; prefetch_factor
+        # (batches queued per worker, capped at 4) only applies then
+        "num_workers": 0,
     }
 
     # Uncomment below to clear previous results
@@ -15,10 +15,14 @@ def parse_args():
     return parser.parse_args()
 
 
+async def rebuild(live_path):
+    async with MatchBase(live_path=live_path) as mb:
+        await mb.build_from_scratch()
+
+
 def main():
     args = parse_args()
-    mb = MatchBase(live_path=args.live_path)
-    asyncio.run(mb.build_from_scratch())
+    asyncio.run(rebuild(args.live_path))
 
 
 if __name__ == "__main__":
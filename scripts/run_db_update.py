@@ -6,25 +6,28 @@ from crawler.match_base import MatchBase
 from crawler.db_handler import DatabaseHandler
 
 
+STAT_KEYS = (
+    "players",
+    "players_with_features",
+    "matches",
+    "matches_vector_complete",
+    "player_match_stats",
+    "player_features",
+)
+
+
 def fetch_stats(match_base: MatchBase) -> Dict[str, int]:
-    conn = match_base.db.conn
-    stats = {
-        "players": conn.execute("SELECT COUNT(*) FROM players").fetchone()[0],
-        "players_with_features": conn.execute(
-            "SELECT COUNT(*) FROM players WHERE has_features=1"
-        ).fetchone()[0],
-        "matches": conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0],
-        "matches_vector_complete": conn.execute(
-            "SELECT COUNT(*) FROM matches WHERE vector_complete=1"
-        ).fetchone()[0],
-        "player_match_stats": conn.execute(
-            "SELECT COUNT(*) FROM player_match_stats"
-        ).fetchone()[0],
-        "player_features": conn.execute(
-            "SELECT COUNT(*) FROM player_features"
-        ).fetchone()[0],
-    }
-    return stats
+    # all six counts in one statement (one prepare/step instead of six)
+    row = match_base.db.conn.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM players),
+            (SELECT COUNT(*) FROM players WHERE has_features=1),
+            (SELECT COUNT(*) FROM matches),
+            (SELECT COUNT(*) FROM matches WHERE vector_complete=1),
+            (SELECT COUNT(*) FROM player_match_stats),
+            (SELECT COUNT(*) FROM player_features)
+    """).fetchone()
+    return dict(zip(STAT_KEYS, row))
 
 
 def print_summary(title: str, stats: Dict[str, int]):
@@ -62,32 +65,31 @@ async def main():
     )
     args = parser.parse_args()
 
-    mb = MatchBase(live_path=args.db, update_path=args.update_db)
-
-    before = fetch_stats(mb)
-    print_summary("Database snapshot (before)", before)
+    async with MatchBase(live_path=args.db, update_path=args.update_db) as mb:
+        before = fetch_stats(mb)
+        print_summary("Database snapshot (before)", before)
 
-    print("\n📀 Copying live → update DB...")
-    mb.copy_live_db()
+        print("\n📀 Copying live → update DB...")
+        mb.copy_live_db()
 
-    # Switch MatchBase to operate on the update DB copy
-    mb.db.conn.close()
-    mb.db = DatabaseHandler(args.update_db)
+        # Switch MatchBase to operate on the update DB copy
+        mb.db.conn.close()
+        mb.db = DatabaseHandler(args.update_db)
 
-    print("⚙️  Updating players on update DB...")
-    await mb.update_all_players(limit=args.limit)
+        print("⚙️  Updating players on update DB...")
+        await mb.update_all_players(limit=args.limit)
 
-    after = fetch_stats(mb)
-    print_deltas(before, after)
+        after = fetch_stats(mb)
+        print_deltas(before, after)
 
-    # Promote the freshly updated DB back to the live location
-    print("\n🚀 Promoting update DB → live DB...")
-    mb.db.conn.close()
-    mb.promote_update_db()
-    mb.db = DatabaseHandler(args.db)
+        # Promote the freshly updated DB back to the live location
+        print("\n🚀 Promoting update DB → live DB...")
+        mb.promote_update_db()
+        mb.db.conn.close()
+        mb.db = DatabaseHandler(args.db)
 
-    final_stats = fetch_stats(mb)
-    print_summary("Database snapshot (after promote)", final_stats)
+        final_stats = fetch_stats(mb)
+        print_summary("Database snapshot (after promote)", final_stats)
 
 
 if __name__ == "__main__":
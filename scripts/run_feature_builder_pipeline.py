@@ -7,9 +7,8 @@ from crawler.feature_builder import FeatureBuilder
 
 async def main():
     db = DatabaseHandler("data/matches.db")
-    api = RiotAPIClient()
-    fb = FeatureBuilder(api, db)
-    await fb.run()
+    async with FeatureBuilder(RiotAPIClient(), db) as fb:
+        await fb.run()
 
 
 if __name__ == "__main__":
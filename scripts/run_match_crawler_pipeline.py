@@ -7,13 +7,12 @@ from crawler.data_collector import PlayerCollector, MatchCrawler
 
 async def main():
     db = DatabaseHandler("data/matches.db")
-    api = RiotAPIClient()
+    async with RiotAPIClient() as api:
+        pc = PlayerCollector(api, db)
+        await pc.seed_players()
 
-    pc = PlayerCollector(api, db)
-    await pc.seed_players()
-
-    mc = MatchCrawler(api, db, matches_per_player=10, target_matches=5000)
-    await mc.run()
+        mc = MatchCrawler(api, db, matches_per_player=10, target_matches=5000)
+        await mc.run()
 
 
 if __name__ == "__main__":
@@ -7,7 +7,9 @@ Generates one example image per visualization and saves
 them to notes/img/.
 """
 
-import os, shutil, matplotlib.pyplot as plt
+import os, shutil, matplotlib
+matplotlib.use("Agg")   # files only; never start a GUI backend
+import matplotlib.pyplot as plt
 from datetime import datetime
 from crawler.match_base import MatchBase
 from core.entities import Player, Team, Match
@@ -78,7 +80,7 @@ def run_all(live_path="data/match_base/live.db",
     try:
         print("\n▶️  Testing NN inference …")
         pred = predict_match_outcome(mb, match, model_path)
-        print(f"✅  Model prediction: {pred:.4f}")
+        print(f"✅  Model prediction: {pred['raw']:.4f}")
     except Exception as e:
         print(f"❌  NN inference failed → {e}")
 
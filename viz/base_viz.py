@@ -52,8 +52,8 @@ class ABCViz(ABC):
         self.mb.log(f"[VIZ] {msg}")
 
     def close(self):
-        """Optional cleanup — closes DB connection if needed."""
-        try:
-            self.conn.close()
-        except Exception:
-            pass
\ No newline at end of file
+        """
+        No-op: the connection belongs to the shared MatchBase, so closing it
+        here would break every other viz built on the same instance.
+        """
+        pass
\ No newline at end of file
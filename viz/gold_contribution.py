@@ -8,7 +8,7 @@ within their own team, normalized so each team’s 5 bars sum to 1 .0.
 
 from .base_viz import ABCViz
 from core.entities import Match, Team
-import json, pandas as pd, numpy as np, matplotlib.pyplot as plt
+import pandas as pd, numpy as np, matplotlib.pyplot as plt
 
 ROLE_COLORS = {
     "TOP": "#5470C6",
@@ -22,23 +22,31 @@ class GoldContribution(ABCViz):
     """Team‑normalized gold‑share bar chart."""
 
     def fetch_data(self, match: Match):
-        """Compute mean player_gold/team_gold for last 10 matches, normalize per team."""
-        def _team_avg(team):
-            vals = []
-            for p in team:
-                rows = self.conn.execute("""
-                    SELECT stats_json FROM player_match_stats
-                    WHERE puuid=? ORDER BY timestamp DESC LIMIT 10
-                """,(p.puuid,)).fetchall()
-                if not rows:
-                    vals.append(0); continue
-                golds=[json.loads(j[0]).get("gold",0) for j in rows]
-                vals.append(np.mean(golds))
-            tot=sum(vals)
-            return [v/tot if tot else 0 for v in vals]
+        """Compute mean player_gold/team_gold for last 10 matches, normalize per team."""
+        # one ranked pass over idx_player_time_gold for all 10 players; the
+        # gold column comes straight from the index, no stats_json decode
+        puuids = match.blue.puuids + match.red.puuids
+        rows = self.conn.execute(f"""
+            WITH recent AS (
+                SELECT puuid, gold,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY puuid ORDER BY timestamp DESC
+                       ) AS rn
+                FROM player_match_stats
+                WHERE puuid IN ({",".join("?" * len(puuids))})
+            )
+            SELECT puuid, AVG(COALESCE(gold, 0))
+            FROM recent WHERE rn <= 10 GROUP BY puuid
+        """, puuids).fetchall()
+        avg_gold = dict(rows)
 
-        blue=_team_avg(match.blue)
-        red =_team_avg(match.red)
+        def _team_share(team):
+            vals = np.array([avg_gold.get(p.puuid, 0) for p in team], dtype=float)
+            tot = vals.sum()
+            return vals / tot if tot else np.zeros_like(vals)
+
+        blue=_team_share(match.blue)
+        red =_team_share(match.red)
         return pd.DataFrame({"blue":blue,"red":red},index=Team.ROLES_ORDER)
 
     def build_figure(self, match: Match):
@@ -46,20 +54,23 @@ class GoldContribution(ABCViz):
         fig, ax = plt.subplots(figsize=(6, 6))
 
         bars_x = {"blue": -0.2, "red": 0.2}
-        for side, x in bars_x.items():
-            bottom = 0
-            shares = data[side]
-            for role, share in zip(Team.ROLES_ORDER, shares):
-                ax.bar(
-                    x,
-                    share,
-                    width=0.35,
-                    bottom=bottom,
-                    color=ROLE_COLORS.get(role, "#999"),
-                    edgecolor="white",
-                    linewidth=0.5,
-                    label=role if side == "blue" else None,
-                )
+        xs = list(bars_x.values())
+        shares = data[list(bars_x)]                 # roles x sides
+        bottoms = shares.cumsum() - shares          # stack offsets per side
+
+        # one bar call per role covers both sides (5 artists, not 10)
+        for role in Team.ROLES_ORDER:
+            ax.bar(
+                xs,
+                shares.loc[role],
+                width=0.35,
+                bottom=bottoms.loc[role],
+                color=ROLE_COLORS.get(role, "#999"),
+                edgecolor="white",
+                linewidth=0.5,
+                label=role,
+            )
+            for x, share, bottom in zip(xs, shares.loc[role], bottoms.loc[role]):
                 ax.text(
                     x,
                     bottom + share / 2,
@@ -69,7 +80,6 @@ class GoldContribution(ABCViz):
                     fontsize=8,
                     color="#1f1f1f",
                 )
-                bottom += share
 
         ax.set_xlim(-0.6, 0.6)
         ax.set_ylim(0, 1)
@@ -2,7 +2,6 @@
 
 from .base_viz import ABCViz
 from core.entities import Match, Team
-import json
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -14,147 +13,107 @@ HEATMAP_BINS = (40, 24)
 class GoldMap(ABCViz):
     """Twin density heatmaps showing where gold share combos cluster."""
 
-    def __init__(self, match_base):
-        super().__init__(match_base)
-        self._match_cache = {}
-        self._stats_cache = {}
+    # last <per_player> stat rows of every requested puuid, each joined to
+    # its match roster + per-player gold and summed per side, all in SQLite.
+    # Gold comes from matches.player_gold_json when it covers the match and
+    # falls back to the participants' player_match_stats rows otherwise;
+    # matches without a clean 10-player roster or all 10 golds are dropped.
+    SHARES_SQL = """
+        WITH picked AS (
+            SELECT puuid, match_id, gold FROM (
+                SELECT puuid, match_id, gold,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY puuid ORDER BY timestamp DESC
+                       ) AS rn
+                FROM player_match_stats
+                WHERE puuid IN ({marks})
+            ) WHERE rn <= ?
+        ),
+        games AS MATERIALIZED (
+            SELECT match_id, puuids_json,
+                   CASE WHEN json_valid(player_gold_json)
+                        THEN player_gold_json END AS gold_json
+            FROM matches
+            WHERE match_id IN (SELECT match_id FROM picked)
+              AND CASE WHEN json_valid(puuids_json)
+                       THEN json_array_length(puuids_json) END = 10
+        ),
+        members AS (
+            SELECT g.match_id, r.value AS puuid, r.key < 5 AS on_blue,
+                   CASE
+                       WHEN (SELECT COUNT(*) FROM json_each(g.gold_json)) >= 10
+                           THEN (SELECT j.value FROM json_each(g.gold_json) j
+                                 WHERE j.key = r.value)
+                       WHEN s.puuid IS NOT NULL THEN COALESCE(s.gold, 0)
+                   END AS gold
+            FROM games g
+            JOIN json_each(g.puuids_json) r
+            LEFT JOIN player_match_stats s
+                   ON s.match_id = g.match_id AND s.puuid = r.value
+        ),
+        sides AS (
+            SELECT match_id,
+                   SUM(CASE WHEN on_blue THEN gold END) AS blue_gold,
+                   SUM(CASE WHEN NOT on_blue THEN gold END) AS red_gold
+            FROM members
+            GROUP BY match_id
+            HAVING COUNT(gold) = 10
+        )
+        SELECT p.puuid, COALESCE(p.gold, 0), m.on_blue, s.blue_gold, s.red_gold
+        FROM picked p
+        JOIN members m ON m.match_id = p.match_id AND m.puuid = p.puuid
+        JOIN sides s ON s.match_id = p.match_id
+    """
 
     # ------------------------------------------------------------------ #
     def fetch_data(self, match: Match, per_player: int = 30):
-        """Return player/team gold share samples for both sides."""
-        payload = {"blue": [], "red": []}
-        roster = {
-            "blue": list(zip(Team.ROLES_ORDER, match.blue.players)),
-            "red": list(zip(Team.ROLES_ORDER, match.red.players)),
-        }
-
-        for side, entries in roster.items():
-            for role, player in entries:
-                rows = self.conn.execute(
-                    """
-                    SELECT match_id, stats_json
-                    FROM player_match_stats
-                    WHERE puuid=?
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                    """,
-                    (player.puuid, per_player)
-                ).fetchall()
-
-                for match_id, stats_blob in rows:
-                    stats = self._safe_json(stats_blob)
-                    if not stats:
-                        continue
-                    share = self._compute_shares(match_id, player.puuid, stats.get("gold", 0))
-                    if not share:
-                        continue
-                    payload[side].append(
-                        {
-                            "player_share": share["player_share"],
-                            "team_share": share["team_share"],
-                            "role": role,
-                        }
-                    )
-
-        return payload
-
-    # ------------------------------------------------------------------ #
-    def _compute_shares(self, match_id: str, puuid: str, player_gold: float):
-        meta = self._match_meta(match_id)
-        stats = self._match_stats(match_id)
-        if not meta or not stats:
-            return None
-
-        if puuid in meta["blue"]:
-            side, other = "blue", "red"
-        elif puuid in meta["red"]:
-            side, other = "red", "blue"
-        else:
-            return None
-
-        if any(p not in stats for p in meta[side]) or any(p not in stats for p in meta[other]):
-            return None
-
-        team_gold = sum(stats[p] for p in meta[side])
-        opponent_gold = sum(stats[p] for p in meta[other])
-        total = team_gold + opponent_gold
-        if team_gold <= 0 or total <= 0:
-            return None
-
-        return {
-            "player_share": player_gold / team_gold,
-            "team_share": team_gold / total,
-        }
-
-    def _match_meta(self, match_id: str):
-        if match_id in self._match_cache:
-            return self._match_cache[match_id]
-        row = self.conn.execute(
-            "SELECT puuids_json FROM matches WHERE match_id=?",
-            (match_id,)
-        ).fetchone()
-        if not row or not row[0]:
-            self.log(f"[GoldMap] Match {match_id} missing roster")
-            return None
-        try:
-            players = json.loads(row[0])
-        except Exception:
-            self.log(f"[GoldMap] Match {match_id} roster JSON invalid")
-            return None
-        if len(players) != 10:
-            self.log(f"[GoldMap] Match {match_id} roster length {len(players)} != 10")
-            return None
-        meta = {
-            "blue": players[:5],
-            "red": players[5:],
-        }
-        self._match_cache[match_id] = meta
-        return meta
-
-    def _match_stats(self, match_id: str):
-        if match_id in self._stats_cache:
-            return self._stats_cache[match_id]
-        row = self.conn.execute(
-            "SELECT player_gold_json FROM matches WHERE match_id=?",
-            (match_id,)
-        ).fetchone()
-        if row and row[0]:
-            payload = self._safe_json(row[0])
-            if isinstance(payload, dict) and len(payload) >= 10:
-                self._stats_cache[match_id] = payload
-                return payload
-
+        """
+        Return per-side arrays of player/team gold share samples:
+        {"blue": {"player_share", "team_share", "role"}, "red": {...}}.
+        Shares are float32; role holds int8 indices into Team.ROLES_ORDER.
+        """
+        slots = [
+            (side, role, player.puuid)
+            for side, team in (("blue", match.blue), ("red", match.red))
+            for role, player in enumerate(team.players)
+        ]
+        puuids = list(dict.fromkeys(p for _, _, p in slots))
         rows = self.conn.execute(
-            "SELECT puuid, stats_json FROM player_match_stats WHERE match_id=?",
-            (match_id,)
+            self.SHARES_SQL.format(marks=",".join("?" * len(puuids))),
+            (*puuids, per_player)
         ).fetchall()
-        if not rows:
-            self.log(f"[GoldMap] Match {match_id} missing player stats rows")
-            return None
-        stats = {}
-        for puuid, blob in rows:
-            data = self._safe_json(blob)
-            if not data:
-                self.log(f"[GoldMap] Match {match_id} has bad stats JSON for {puuid[:8]}")
-                continue
-            stats[puuid] = data.get("gold", 0)
-        if len(stats) < 10:
-            self.log(f"[GoldMap] Match {match_id} has {len(stats)} player stats < 10")
-            return None
-        self._stats_cache[match_id] = stats
-        return stats
-
-    @staticmethod
-    def _safe_json(blob):
-        try:
-            return json.loads(blob)
-        except Exception:
-            return None
+
+        row_puuid = np.array([r[0] for r in rows], dtype=object)
+        pg, on_blue, blue_gold, red_gold = (
+            np.array([r[1:] for r in rows], dtype=float).reshape(-1, 4).T
+        )
+        team_gold = np.where(on_blue == 1, blue_gold, red_gold)
+        total = blue_gold + red_gold
+        with np.errstate(divide="ignore", invalid="ignore"):
+            player_share = pg / team_gold
+            team_share = team_gold / total
+        valid = (team_gold > 0) & (total > 0)
+
+        payload = {}
+        for side in ("blue", "red"):
+            picks = [
+                (valid & (row_puuid == puuid), role)
+                for s, role, puuid in slots if s == side
+            ]
+            payload[side] = {
+                "player_share": np.concatenate(
+                    [player_share[m] for m, _ in picks]).astype(np.float32),
+                "team_share": np.concatenate(
+                    [team_share[m] for m, _ in picks]).astype(np.float32),
+                "role": np.concatenate(
+                    [np.full(m.sum(), role, dtype=np.int8) for m, role in picks]),
+            }
+        return payload
 
     # ------------------------------------------------------------------ #
     def build_figure(self, match: Match):
         data = self.fetch_data(match)
-        if not data["blue"] and not data["red"]:
+        if not data["blue"]["player_share"].size and not data["red"]["player_share"].size:
             print("❌ GoldMap: insufficient shared matches to plot.")
             return None
 
@@ -163,19 +122,24 @@ class GoldMap(ABCViz):
 
         for ax, (side, cmap) in zip(axes, sides):
             samples = data[side]
-            if not samples:
+            if not samples["player_share"].size:
                 ax.text(0.5, 0.5, "No data", ha="center", va="center", fontsize=12)
                 ax.set_axis_off()
                 continue
-            player_shares = np.clip([s["player_share"] for s in samples], *PLAYER_SHARE_RANGE)
-            team_shares = np.clip([s["team_share"] for s in samples], *TEAM_SHARE_RANGE)
-            heat, xedges, yedges = np.histogram2d(
-                player_shares,
-                team_shares,
-                bins=HEATMAP_BINS,
-                range=(PLAYER_SHARE_RANGE, TEAM_SHARE_RANGE),
-            )
-            heat = np.log1p(heat)
+            player_shares = np.clip(samples["player_share"], *PLAYER_SHARE_RANGE)
+            team_shares = np.clip(samples["team_share"], *TEAM_SHARE_RANGE)
+            # uniform bins over clipped values: bin index is plain arithmetic,
+            # so one bincount replaces histogram2d's edge search
+            nx, ny = HEATMAP_BINS
+            ix = ((player_shares - PLAYER_SHARE_RANGE[0])
+                  / (PLAYER_SHARE_RANGE[1] - PLAYER_SHARE_RANGE[0]) * nx)
+            iy = ((team_shares - TEAM_SHARE_RANGE[0])
+                  / (TEAM_SHARE_RANGE[1] - TEAM_SHARE_RANGE[0]) * ny)
+            ix = ix.astype(np.intp).clip(0, nx - 1)
+            iy = iy.astype(np.intp).clip(0, ny - 1)
+            heat = np.bincount(ix * ny + iy, minlength=nx * ny)
+            heat = heat.reshape(nx, ny).astype(np.float32)
+            np.log1p(heat, out=heat)
             if heat.max() > 0:
                 heat /= heat.max()
             im = ax.imshow(
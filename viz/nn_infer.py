@@ -1,96 +1,147 @@
 """Model inference helpers + visualization."""
 
-import json, torch, pandas as pd, numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.patches import Wedge
+import torch, numpy as np
+from functools import lru_cache
 from core.entities import Team, Match
 from ml.models.moe_transformer import MatchAttnMoEModel
 
 
 # ----------------------------------------------------------- #
-# Safe number helper
+# Tier normalisation
 # ----------------------------------------------------------- #
-def safe_num(x):
-    try:
-        if x is None or (isinstance(x, float) and np.isnan(x)):
-            return 0.0
-        return float(x)
-    except Exception:
-        return 0.0
+TIER_NORM_MAP = {
+    None: 0.3, "IRON": 0.05, "BRONZE": 0.1, "SILVER": 0.2,
+    "GOLD": 0.3, "PLATINUM": 0.4, "EMERALD": 0.5,
+    "DIAMOND": 0.6, "MASTER": 0.75, "GRANDMASTER": 0.9, "CHALLENGER": 1.0
+}
+
+
+PLAYER_VEC_CACHE_SIZE = 4096
+# (db file path, puuid) -> ((newest ts, row count, max rowid, tier), feats)
+_player_vecs = {}
 
 
 # ----------------------------------------------------------- #
 # Feature builders
 # ----------------------------------------------------------- #
-def build_player_vector(conn, puuid):
+def build_player_vectors(conn, puuids):
     """
-    Construct the 13‑feature numeric vector for one player
-    directly from the live DB.
+    Construct the 13‑feature numeric vector for every puuid in one
+    ranked query against the live DB → {puuid: feats}.
     """
-    # ---- Static ----
-    srow = conn.execute(
-        "SELECT tier FROM players WHERE puuid=?", (puuid,)
-    ).fetchone()
-    tier = srow[0] if srow else None
-    tier_norm_map = {
-        None: 0.3, "IRON": 0.05, "BRONZE": 0.1, "SILVER": 0.2,
-        "GOLD": 0.3, "PLATINUM": 0.4, "EMERALD": 0.5,
-        "DIAMOND": 0.6, "MASTER": 0.75, "GRANDMASTER": 0.9, "CHALLENGER": 1.0
-    }
-    tier_norm = safe_num(tier_norm_map.get(tier, 0.3))
+    puuids = list(dict.fromkeys(puuids))
 
     # ---- Dynamic averages ----
-    cur = conn.execute("""
-        SELECT stats_json FROM player_match_stats
-        WHERE puuid=? ORDER BY timestamp DESC LIMIT 10
-    """, (puuid,))
-    rows = cur.fetchall()
-    if not rows:
-        return [0.0] * 13
-
-    stats = [json.loads(j[0]) for j in rows]
-    df = pd.DataFrame(stats)
-
-    kills   = safe_num(df["kills"].mean())
-    deaths  = safe_num(df["deaths"].mean())
-    assists = safe_num(df["assists"].mean())
-    gold_pm = safe_num(df["gold"].mean())
-    cs_pm   = safe_num(((df["kills"] + df["assists"]) / 10).mean())
-    vision  = safe_num(df["vision"].mean())
-    damage  = safe_num(df["damage"].mean())
-    win_r   = 0.5  # placeholder until stored
-
-    feats = [
-        tier_norm, 0.0, 0.0, 0.0, 0.0,
-        kills, deaths, assists,
-        gold_pm, cs_pm,
-        vision, damage, win_r,
-    ]
-    return feats
+    # JSON1 + AVG over each player's last 10 rows; NULLs (missing keys) are
+    # skipped the same way DataFrame.mean() skipped NaN
+    rows = conn.execute(f"""
+        WITH recent AS (
+            SELECT puuid, stats_json,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY puuid ORDER BY timestamp DESC
+                   ) AS rn
+            FROM player_match_stats
+            WHERE puuid IN ({",".join("?" * len(puuids))})
+        )
+        SELECT r.puuid,
+               (SELECT tier FROM players p WHERE p.puuid = r.puuid),
+               AVG(json_extract(stats_json, '$.kills')),
+               AVG(json_extract(stats_json, '$.deaths')),
+               AVG(json_extract(stats_json, '$.assists')),
+               AVG(json_extract(stats_json, '$.gold')),
+               AVG((json_extract(stats_json, '$.kills')
+                    + json_extract(stats_json, '$.assists')) / 10.0),
+               AVG(json_extract(stats_json, '$.vision')),
+               AVG(json_extract(stats_json, '$.damage'))
+        FROM recent r WHERE rn <= 10 GROUP BY r.puuid
+    """, puuids).fetchall()
+
+    # players without stored matches keep the all-zero vector
+    vecs = {p: [0.0] * 13 for p in puuids}
+    for puuid, tier, *avgs in rows:
+        tier_norm = TIER_NORM_MAP.get(tier, 0.3)
+        # SQLite AVG yields a float or NULL, never NaN
+        kills, deaths, assists, gold_pm, cs_pm, vision, damage = (
+            float(v or 0.0) for v in avgs
+        )
+        win_r   = 0.5  # placeholder until stored
+
+        vecs[puuid] = [
+            tier_norm, 0.0, 0.0, 0.0, 0.0,
+            kills, deaths, assists,
+            gold_pm, cs_pm,
+            vision, damage, win_r,
+        ]
+    return vecs
+
+
+def cached_player_vectors(conn, puuids):
+    """
+    build_player_vectors behind a per-player memo keyed on the DB file and
+    stamped with each player's newest timestamp, row count, max rowid and
+    tier; one index-only query checks every stamp, and only players whose
+    history moved (including inserts of older games) are rebuilt.
+    """
+    puuids = list(dict.fromkeys(puuids))
+    # the file path, not id(conn): ids are reused once a connection is freed
+    db = conn.execute("PRAGMA database_list").fetchone()[2]
+    stamps = {
+        puuid: tuple(stamp)
+        for puuid, *stamp in conn.execute(f"""
+            SELECT s.puuid, MAX(s.timestamp), COUNT(*), MAX(s.rowid),
+                   (SELECT tier FROM players p WHERE p.puuid = s.puuid)
+            FROM player_match_stats s
+            WHERE s.puuid IN ({",".join("?" * len(puuids))})
+            GROUP BY s.puuid
+        """, puuids)
+    }
+
+    vecs, stale = {}, []
+    for puuid in puuids:
+        hit = _player_vecs.get((db, puuid))
+        if puuid not in stamps:
+            vecs[puuid] = [0.0] * 13  # no stored matches
+        elif hit and hit[0] == stamps[puuid]:
+            vecs[puuid] = hit[1]
+        else:
+            stale.append(puuid)
+
+    if stale:
+        for puuid, feats in build_player_vectors(conn, stale).items():
+            key = (db, puuid)
+            _player_vecs.pop(key, None)
+            if len(_player_vecs) >= PLAYER_VEC_CACHE_SIZE:
+                del _player_vecs[next(iter(_player_vecs))]
+            _player_vecs[key] = (stamps[puuid], feats)
+            vecs[puuid] = feats
+    return vecs
 
 
 def build_team_tensor(match_base, team: Team):
     """Return [5,13] tensor for the given team."""
-    conn = match_base.db.conn
-    rows = [build_player_vector(conn, p.puuid) for p in team]
-    return torch.tensor(rows, dtype=torch.float32)
+    vecs = cached_player_vectors(match_base.db.conn, team.puuids)
+    return torch.from_numpy(
+        np.array([vecs[p] for p in team.puuids], dtype=np.float32)
+    )
 
 
 def build_match_tensor(match_base, match: Match):
-    """Concatenate the two team tensors → [10,13] match tensor."""
-    blue_tensor = build_team_tensor(match_base, match.blue)
-    red_tensor  = build_team_tensor(match_base, match.red)
-    return torch.cat([blue_tensor, red_tensor], dim=0)
+    """[10,13] match tensor, blue then red, from one query for all 10 players."""
+    puuids = match.blue.puuids + match.red.puuids
+    vecs = cached_player_vectors(match_base.db.conn, puuids)
+    # numpy packs the nested lists in C; from_numpy then shares that buffer
+    return torch.from_numpy(np.array([vecs[p] for p in puuids], dtype=np.float32))
 
 
 # ----------------------------------------------------------- #
 # Model loading + inference
 # ----------------------------------------------------------- #
-def load_model(weights_path="weights/moeT_003.pt", device=None):
+def load_model(weights_path="weights/moeT_003.pt", device="cpu"):
     """
     Load MatchAttnMoEModel weights (supports state_dict or full model).
+    CPU by default: a [1,10,13] forward costs less than the host↔device
+    copy and kernel launches, so pass device="cuda" only for big batches.
     """
-    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
     model = MatchAttnMoEModel()
     checkpoint = torch.load(weights_path, map_location=device)
 
@@ -106,25 +157,63 @@ def load_model(weights_path="weights/moeT_003.pt", device=None):
     return model, device
 
 
+@lru_cache(maxsize=4)
 @torch.no_grad()
+def cached_model(weights_path="weights/moeT_003.pt"):
+    """
+    load_model once per weights file, traced on a (1,10,13) match input so
+    repeat predictions skip the checkpoint read and Python module dispatch.
+    """
+    model, device = load_model(weights_path)
+    example = torch.zeros(1, 10, 13, device=device)
+    return torch.jit.trace(model, example), device
+
+
 def predict_match_outcome(match_base, match: Match,
                           model_path="weights/moeT_003.pt"):
     """Return raw regression output plus clipped blue/red success scores."""
-    X = build_match_tensor(match_base, match).unsqueeze(0)
-    model, device = load_model(model_path)
-    X = X.to(device)
-    y_pred = model(X)
-    raw = float(y_pred.squeeze().cpu().item())
-    blue_success = float(np.clip(raw, 0.0, 1.0))
-    return {
-        "raw": raw,
-        "blue_success": blue_success,
-        "red_success": 1.0 - blue_success,
-    }
+    return predict_matches(match_base, [match], model_path)[0]
+
+
+def predict_matches(match_base, matches, model_path="weights/moeT_003.pt"):
+    """
+    Score many matches with one [N,10,13] forward; players shared between
+    rosters are built once. Returns one predict_match_outcome dict per match.
+    """
+    if not matches:
+        return []
+    # trace (first call) happens outside inference_mode so the cached
+    # module holds ordinary tensors; the forward itself skips autograd
+    # and version-counter bookkeeping entirely. The trace reads B from
+    # x.size(0), so any batch size runs through it.
+    model, device = cached_model(model_path)
+    rosters = [m.blue.puuids + m.red.puuids for m in matches]
+    vecs = cached_player_vectors(
+        match_base.db.conn, [p for roster in rosters for p in roster]
+    )
+    with torch.inference_mode():
+        X = torch.from_numpy(np.array(
+            [[vecs[p] for p in roster] for roster in rosters], dtype=np.float32
+        ))
+        y_pred = model(X.to(device))
+
+    results = []
+    for raw in y_pred.reshape(-1).cpu().tolist():
+        blue_success = float(np.clip(raw, 0.0, 1.0))
+        results.append({
+            "raw": raw,
+            "blue_success": blue_success,
+            "red_success": 1.0 - blue_success,
+        })
+    return results
 
 
 def build_speedometer(blue_success: float):
     """Render a horizontal split bar (blue vs red share)."""
+    # pyplot only loads once a gauge is drawn; scoring alone never pays
+    # for matplotlib's import and font cache
+    import matplotlib.pyplot as plt
+
     blue_success = float(np.clip(blue_success, 0.0, 1.0))
     red_success = 1.0 - blue_success
 
@@ -185,6 +274,7 @@ def build_speedometer(blue_success: float):
 if __name__ == "__main__":
     from crawler.match_base import MatchBase
     from core.entities import Player, Team, Match
+    import matplotlib.pyplot as plt
 
     mb = MatchBase(live_path="data/match_base/live.db")
     puuids = [r[0] for r in mb.db.conn.execute("SELECT puuid FROM players LIMIT 10")]
@@ -6,7 +6,7 @@ PlayerProfile visualization – now expects a Player object.
 
 from .base_viz import ABCViz
 from core.entities import Player
-import json, pandas as pd, numpy as np, matplotlib.pyplot as plt
+import orjson, pandas as pd, numpy as np, matplotlib.pyplot as plt
 
 RADAR_METRICS = [
     ("gold", "Gold Earned", 20000),
@@ -14,6 +14,11 @@ RADAR_METRICS = [
     ("cs_per_min", "CS / Min", 12),
     ("vision", "Vision Score", 60),
 ]
+# fixed by RADAR_METRICS, so computed once rather than per render
+RADAR_MAX = np.array([m[2] for m in RADAR_METRICS], dtype=float)
+RADAR_ANGLES = np.linspace(0, 2*np.pi, len(RADAR_METRICS), endpoint=False)
+RADAR_ANGLES_CLOSED = np.append(RADAR_ANGLES, RADAR_ANGLES[0])
+RADAR_DEGREES = np.degrees(RADAR_ANGLES)
 
 class PlayerProfile(ABCViz):
     """Displays a single player's static and dynamic statistics."""
@@ -28,12 +33,12 @@ class PlayerProfile(ABCViz):
         print(f"PLAYER {player.puuid[:8]}: TIER = {static['tier']}")
 
         cur = self.conn.execute("""
-            SELECT stats_json, timestamp
+            SELECT CAST(stats_json AS BLOB), timestamp
             FROM player_match_stats
             WHERE puuid=? ORDER BY timestamp DESC LIMIT 10
         """, (player.puuid,))
         recs = [
-            {**json.loads(js), "timestamp": ts, "match_num": i+1}
+            {**orjson.loads(js), "timestamp": ts, "match_num": i+1}
             for i, (js, ts) in enumerate(cur.fetchall())
         ]
         df = pd.DataFrame(recs)
@@ -66,14 +71,10 @@ class PlayerProfile(ABCViz):
         stats = data["averages"]
         keys = [m[0] for m in RADAR_METRICS]
         raw_vals = [stats.get(k, 0) for k in keys]
-        scaled_vals = []
-        for raw, (_, _, maximum) in zip(raw_vals, RADAR_METRICS):
-            scaled = raw / maximum if maximum else raw
-            scaled_vals.append(max(0.0, min(scaled, 1.0)))
-        scaled_vals += scaled_vals[:1]
-
-        angs = np.linspace(0, 2*np.pi, len(RADAR_METRICS), endpoint=False).tolist()
-        angs += angs[:1]
+        # NaN (metric missing from every match) plots at 0, as before
+        scaled_vals = np.clip(np.nan_to_num(np.array(raw_vals, dtype=float) / RADAR_MAX), 0.0, 1.0)
+        scaled_vals = np.append(scaled_vals, scaled_vals[0])
+        angs = RADAR_ANGLES_CLOSED
 
         ax2 = fig.add_subplot(1,2,2, polar=True)
         ax2.set_theta_offset(np.pi / 2)
@@ -81,14 +82,14 @@ class PlayerProfile(ABCViz):
         ax2.set_ylim(0, 1)
         ax2.set_title("Average Performance (Normalized)")
         ax2.set_thetagrids(
-            np.degrees(angs[:-1]),
+            RADAR_DEGREES,
             [label for _, label, _ in RADAR_METRICS]
         )
         ax2.set_rgrids([0.25, 0.5, 0.75, 1.0], angle=22.5, fontsize=8)
         ax2.plot(angs, scaled_vals, color="tab:green", linewidth=2)
         ax2.fill(angs, scaled_vals, alpha=0.2, color="tab:green")
 
-        for angle, raw, (metric, _, _) in zip(angs[:-1], raw_vals, RADAR_METRICS):
+        for angle, raw, (metric, _, _) in zip(RADAR_ANGLES, raw_vals, RADAR_METRICS):
             fmt = f"{raw:.1f}" if metric in {"cs_per_min", "vision"} else f"{raw:,.0f}"
             ax2.text(angle, 1.08, fmt, fontsize=8, ha="center", va="center", color="dimgray")
 
@@ -15,7 +15,7 @@ Output:
 
 from .base_viz import ABCViz
 from core.entities import Match, Team
-import json, numpy as np, pandas as pd, matplotlib.pyplot as plt
+import numpy as np, pandas as pd, matplotlib.pyplot as plt
 
 METRICS = [
     ("gold", "Gold", 20000),
@@ -23,6 +23,11 @@ METRICS = [
     ("vision", "Vision", 60),
     ("kda", "KDA", 6),
 ]
+# fixed by METRICS, so computed once rather than per render
+METRIC_MAX = pd.Series({m[0]: m[2] for m in METRICS}, dtype=float)
+ANGLES = np.linspace(0, 2*np.pi, len(METRICS), endpoint=False)
+ANGLES_CLOSED = np.append(ANGLES, ANGLES[0])
+DEGREES = np.degrees(ANGLES)
 
 class SpiderStats(ABCViz):
     """Team‑comparison spider chart."""
@@ -30,31 +35,49 @@ class SpiderStats(ABCViz):
     # ------------------------------------------------------------ #
     def fetch_data(self, match: Match):
         """Aggregate last 10 matches for each player, return team averages."""
+        # last 10 rows of all 10 players in one ranked query; JSON1 pulls the
+        # six stats out and AVG()s them per player, so no blob reaches Python
+        puuids = match.blue.puuids + match.red.puuids
+        rows = self.conn.execute(f"""
+            WITH recent AS (
+                SELECT puuid, stats_json,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY puuid ORDER BY timestamp DESC
+                       ) AS rn
+                FROM player_match_stats
+                WHERE puuid IN ({",".join("?" * len(puuids))})
+            )
+            SELECT puuid,
+                   AVG(json_extract(stats_json, '$.gold')),
+                   AVG(json_extract(stats_json, '$.damage')),
+                   AVG(json_extract(stats_json, '$.vision')),
+                   AVG(json_extract(stats_json, '$.kills')),
+                   AVG(json_extract(stats_json, '$.assists')),
+                   AVG(json_extract(stats_json, '$.deaths'))
+            FROM recent WHERE rn <= 10 GROUP BY puuid
+        """, puuids).fetchall()
+
+        per_player = pd.DataFrame()
+        if rows:
+            means = pd.DataFrame(
+                [r[1:] for r in rows],
+                index=[r[0] for r in rows],
+                columns=["gold", "damage", "vision", "kills", "assists", "deaths"],
+                dtype=float,
+            )
+            per_player = pd.DataFrame({
+                "gold": means["gold"],
+                "damage": means["damage"],
+                "vision": means["vision"],
+                "kda": (means["kills"] + means["assists"]) / means["deaths"].clip(lower=1),
+            })
+
         def _aggregate(team):
-            recs = []
-            for player in team:
-                cur = self.conn.execute("""
-                    SELECT stats_json FROM player_match_stats
-                    WHERE puuid=? ORDER BY timestamp DESC LIMIT 10
-                """, (player.puuid,))
-                rows = cur.fetchall()
-                if not rows:
-                    continue
-                stats = [json.loads(j[0]) for j in rows]
-                df = pd.DataFrame(stats)
-                if df.empty:
-                    continue
-                summary = pd.Series({
-                    "gold": df["gold"].mean(),
-                    "damage": df["damage"].mean(),
-                    "vision": df["vision"].mean(),
-                    "kda": (df["kills"].mean() + df["assists"].mean()) / max(1, df["deaths"].mean()),
-                })
-                recs.append(summary)
-            if not recs:
+            # players without stored matches are left out of the team mean
+            recs = per_player[per_player.index.isin(team.puuids)]
+            if recs.empty:
                 return pd.Series(dtype=float)
-            team_avg = pd.concat(recs, axis=1).mean(axis=1)
-            return team_avg
+            return recs.mean()
 
         blue_avg = _aggregate(match.blue)
         red_avg  = _aggregate(match.red)
@@ -73,15 +96,8 @@ class SpiderStats(ABCViz):
             if metric not in data.index:
                 data.loc[metric] = 0
 
-        ordered = data.loc[[m[0] for m in METRICS]]
-        normed = ordered.copy()
-        for metric, _, max_val in METRICS:
-            normed.loc[metric] = ordered.loc[metric] / max_val if max_val else ordered.loc[metric]
-        normed = normed.clip(lower=0, upper=1)
-
-        n = len(METRICS)
-        angles = np.linspace(0, 2*np.pi, n, endpoint=False).tolist()
-        angles += angles[:1]
+        ordered = data.loc[METRIC_MAX.index]
+        normed = ordered.div(METRIC_MAX, axis=0).clip(lower=0, upper=1)
 
         def _vals(side):
             values = normed.loc[:, side].tolist()
@@ -95,12 +111,12 @@ class SpiderStats(ABCViz):
 
         vals_blue = _vals("blue")
         vals_red = _vals("red")
-        ax.plot(angles, vals_blue, color="tab:blue", linewidth=2, label="Blue team")
-        ax.fill(angles, vals_blue, color="tab:blue", alpha=0.2)
-        ax.plot(angles, vals_red, color="tab:red", linewidth=2, label="Red team")
-        ax.fill(angles, vals_red, color="tab:red", alpha=0.2)
+        ax.plot(ANGLES_CLOSED, vals_blue, color="tab:blue", linewidth=2, label="Blue team")
+        ax.fill(ANGLES_CLOSED, vals_blue, color="tab:blue", alpha=0.2)
+        ax.plot(ANGLES_CLOSED, vals_red, color="tab:red", linewidth=2, label="Red team")
+        ax.fill(ANGLES_CLOSED, vals_red, color="tab:red", alpha=0.2)
 
-        ax.set_thetagrids(np.degrees(angles[:-1]), [label for _, label, _ in METRICS], fontsize=11)
+        ax.set_thetagrids(DEGREES, [label for _, label, _ in METRICS], fontsize=11)
         ax.set_rgrids([0.25, 0.5, 0.75, 1.0], angle=-45, fontsize=8)
         ax.set_ylim(0, 1)
         ax.set_title("Spider Stats – Normalized Team Profile", fontsize=13, pad=18)